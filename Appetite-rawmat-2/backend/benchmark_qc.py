@@ -0,0 +1,260 @@
+# ===============================
+# benchmark_qc.py
+# ===============================
+# benchmark run_qc แบบ offline บนภาพ test / valid ที่มากับ dataset
+# - ไม่ต่อ Supabase (stub database.async_client ก่อน import qc_service)
+# - วัด throughput, p50 / p95 / p99 ต่อขั้น (decode, inference, ...) และต่อโมเดล
+#   + peak RSS ของ process
+# - บันทึกผลเป็น JSON → เทียบ 2 รอบด้วย --compare (จับ regression ก่อนขึ้นไลน์)
+#
+# ใช้งาน:
+#   python benchmark_qc.py --out bench/torch.json
+#   python benchmark_qc.py --backend onnx --threads 4 --imgsz 512 --out bench/onnx.json
+#   python benchmark_qc.py --backend onnx --compare bench/torch.json
+#   python benchmark_qc.py --mode weight --overlay --compare bench/torch.json
+# ===============================
+
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import types
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_DIR = os.path.dirname(BASE_DIR)
+SPLITS = ("test", "valid")
+
+
+# ===============================
+# Environment (ต้องตั้งก่อน import qc_service)
+# ===============================
+
+class _SupabaseStub:
+    """แทน client จริง: benchmark ห้ามแตะ network / DB"""
+
+    def __getattr__(self, name):
+        raise RuntimeError(f"Supabase is stubbed out in benchmark (.{name})")
+
+
+def stub_supabase():
+    module = types.ModuleType("database.async_client")
+    module.async_db = _SupabaseStub()
+    sys.modules["database.async_client"] = module
+
+
+def configure_env(args):
+    os.environ["QC_BACKEND"] = args.backend
+    os.environ["QC_PRECISION"] = args.precision
+    os.environ["QC_MODE"] = args.mode
+
+    if args.threads:
+        os.environ["QC_TORCH_THREADS"] = str(args.threads)
+        os.environ["OMP_NUM_THREADS"] = str(args.threads)
+
+    if args.imgsz:
+        os.environ["QC_IMGSZ"] = str(args.imgsz)
+        os.environ["QC_DECODE_SIZE"] = str(args.imgsz)
+
+
+# ===============================
+# Measure
+# ===============================
+
+def peak_rss_mb() -> float | None:
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux = KB, macOS = bytes
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        pass
+
+    try:
+        import psutil
+
+        info = psutil.Process().memory_info()
+        # Windows มี peak_wset
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def percentiles(values_ms: list[float]) -> dict:
+    import numpy as np
+
+    arr = np.array(values_ms)
+    return {
+        "count": len(values_ms),
+        "mean": round(float(arr.mean()), 2),
+        "p50": round(float(np.percentile(arr, 50)), 2),
+        "p95": round(float(np.percentile(arr, 95)), 2),
+        "p99": round(float(np.percentile(arr, 99)), 2),
+    }
+
+
+def collect_images(splits: list[str], limit: int) -> list[str]:
+    images = []
+    for split in splits:
+        images += sorted(glob.glob(os.path.join(DATASET_DIR, split, "images", "*.jpg")))
+    return images[:limit] if limit else images
+
+
+def run_benchmark(args, images: list[str]) -> dict:
+    # import หลังตั้ง env + stub แล้วเท่านั้น
+    from imaging import decode_image_reduced, encode_png
+    from metrics import timed
+    from model_registry import registry
+    from qc_service import configure_cpu_threads, render_overlay, run_qc
+
+    started = time.perf_counter()
+    configure_cpu_threads()
+    registry.load_all()
+    load_seconds = time.perf_counter() - started
+
+    # warmup รอบแรก ๆ ไม่นับ
+    for path in images[: args.warmup]:
+        with open(path, "rb") as f:
+            run_qc(decode_image_reduced(f.read())[0])
+
+    samples = {}   # stage → [ms]
+
+    started = time.perf_counter()
+
+    for path in images:
+        timings = {}
+
+        with open(path, "rb") as f:
+            data = f.read()
+
+        with timed("total", timings):
+            with timed("decode", timings):
+                img, _ = decode_image_reduced(data)
+
+            result = run_qc(img, timings=timings)
+
+            if args.overlay:
+                with timed("overlay_render", timings):
+                    overlay = render_overlay(img, result["detections"])
+                with timed("overlay_encode_png", timings):
+                    encode_png(overlay)
+
+        for stage, ms in timings.items():
+            samples.setdefault(stage, []).append(ms)
+
+    wall = time.perf_counter() - started
+
+    stages = {k: percentiles(v) for k, v in samples.items() if not k.startswith("model.")}
+    per_model = {
+        k[len("model."):]: percentiles(v) for k, v in samples.items() if k.startswith("model.")
+    }
+
+    return {
+        "meta": {
+            "backend": args.backend,
+            "precision": args.precision,
+            "mode": args.mode,
+            "threads": args.threads or None,
+            "imgsz": args.imgsz or None,
+            "splits": args.splits,
+            "images": len(images),
+            "warmup": args.warmup,
+            "overlay": args.overlay,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "models": {
+                name: {k: info[k] for k in ("backend", "precision", "path", "version")}
+                for name, info in registry.info.items()
+            },
+        },
+        "load_seconds": round(load_seconds, 2),
+        "wall_seconds": round(wall, 2),
+        "throughput_ips": round(len(images) / wall, 2) if wall else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+        "models": per_model,
+    }
+
+
+# ===============================
+# Report
+# ===============================
+
+def _delta(new: float, old: float) -> str:
+    if not old:
+        return ""
+    return f" ({(new - old) / old:+.1%})"
+
+
+def print_report(report: dict, baseline: dict | None = None):
+    base_stages = (baseline or {}).get("stages", {})
+    base_models = (baseline or {}).get("models", {})
+
+    print()
+    print(f"images {report['meta']['images']} | "
+          f"throughput {report['throughput_ips']} img/s"
+          f"{_delta(report['throughput_ips'] or 0, (baseline or {}).get('throughput_ips') or 0)} | "
+          f"peak RSS {report['peak_rss_mb']} MB")
+    print()
+    print(f"{'stage':<24}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}")
+
+    for title, rows, base in (("", report["stages"], base_stages), ("model.", report["models"], base_models)):
+        for name, r in rows.items():
+            b = base.get(name, {})
+            print(
+                f"{title + name:<24}"
+                f"{r['p50']:>8.1f}{_delta(r['p50'], b.get('p50')):>8}"
+                f"{r['p95']:>8.1f}{_delta(r['p95'], b.get('p95')):>8}"
+                f"{r['p99']:>8.1f}{_delta(r['p99'], b.get('p99')):>8}"
+            )
+
+
+# ===============================
+# Main
+# ===============================
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline run_qc benchmark")
+    parser.add_argument("--backend", choices=["torch", "onnx", "openvino"], default="torch")
+    parser.add_argument("--precision", choices=["fp32", "int8"], default="fp32")
+    parser.add_argument("--mode", choices=["count", "weight"], default="count")
+    parser.add_argument("--threads", type=int, default=0, help="torch thread ของทั้ง process (0 = ค่า default)")
+    parser.add_argument("--imgsz", type=int, default=0, help="ขนาด input ของโมเดล (0 = ค่าของโมเดล)")
+    parser.add_argument("--splits", nargs="+", choices=SPLITS, default=list(SPLITS))
+    parser.add_argument("--limit", type=int, default=0, help="จำนวนภาพ (0 = ทั้งหมด)")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--overlay", action="store_true", help="วัด render + encode overlay ด้วย")
+    parser.add_argument("--out", help="ไฟล์ JSON ผลลัพธ์")
+    parser.add_argument("--compare", help="JSON ของรอบก่อน (แสดง % ที่เปลี่ยน)")
+    args = parser.parse_args()
+
+    images = collect_images(args.splits, args.limit)
+    if not images:
+        print("❌ No images found in", ", ".join(args.splits))
+        sys.exit(1)
+
+    stub_supabase()
+    configure_env(args)
+
+    report = run_benchmark(args, images)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_report(report, baseline)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, sort_keys=True)
+        print(f"\n✅ Saved: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
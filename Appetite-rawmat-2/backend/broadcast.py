@@ -0,0 +1,66 @@
+# ===============================
+# broadcast.py
+# ===============================
+# fan-out ค่าล่าสุดจาก thread ใดก็ได้ → subscriber async หลายตัว
+# - publish ครั้งเดียว ทุก subscriber ได้ object เดียวกัน (ไม่ copy / ไม่ encode ซ้ำ)
+# - ไม่มีคิวต่อ subscriber: ตัวที่ช้าจะได้ค่าล่าสุดเสมอ ค่าที่พลาดไปถูกข้าม
+# ===============================
+
+import asyncio
+import threading
+
+
+class Broadcaster:
+
+    def __init__(self):
+        # (seq, item) แทนที่ทั้ง tuple ทีเดียว
+        self._latest = (0, None)
+        self._lock = threading.Lock()
+        self._subscribers = set()   # {(loop, asyncio.Event)}
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def latest(self):
+        return self._latest[1]
+
+    def publish(self, item):
+        """เรียกจาก thread ไหนก็ได้"""
+        with self._lock:
+            self._latest = (self._latest[0] + 1, item)
+            subscribers = list(self._subscribers)
+
+        for loop, event in subscribers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # event loop ปิดไปแล้ว
+                pass
+
+    async def subscribe(self):
+        """
+        async generator: yield ค่าใหม่ทุกครั้งที่มีการ publish
+        (ค่าแรกคือค่าล่าสุดที่มีอยู่แล้ว ถ้ามี)
+        """
+        sub = (asyncio.get_running_loop(), asyncio.Event())
+
+        with self._lock:
+            self._subscribers.add(sub)
+
+        last_seq = 0
+
+        try:
+            while True:
+                sub[1].clear()
+
+                seq, item = self._latest
+                if seq != last_seq and item is not None:
+                    last_seq = seq
+                    yield item
+
+                await sub[1].wait()
+        finally:
+            with self._lock:
+                self._subscribers.discard(sub)
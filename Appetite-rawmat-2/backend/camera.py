@@ -0,0 +1,110 @@
+# ===============================
+# camera.py
+# ===============================
+# thread อ่านกล้องตลอดเวลา เก็บเฉพาะ frame ล่าสุด
+# - ไม่มี frame ค้างใน buffer ของ driver (อ่านทิ้งตลอด)
+# - ผู้อ่าน (/qc/camera, /cctv, stream QC) หยิบ frame ล่าสุดได้ทันที ไม่ต้องรอ lock
+# - source หลุด (RTSP) → reconnect เองเหมือน camera_loop เดิม
+# ===============================
+
+import os
+import threading
+import time
+
+import cv2
+
+# "0", "1" = USB camera index, อื่น ๆ = URL (rtsp://...)
+CAMERA_SOURCE = os.getenv("CAMERA_SOURCE", "0")
+CAMERA_RECONNECT_SECONDS = float(os.getenv("CAMERA_RECONNECT_SECONDS", 2))
+
+
+def _open_capture(source: str):
+    if source.isdigit():
+        return cv2.VideoCapture(int(source))
+
+    cap = cv2.VideoCapture(source, cv2.CAP_FFMPEG)
+    cap.set(cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, 10000)
+    cap.set(cv2.CAP_PROP_READ_TIMEOUT_MSEC, 10000)
+    return cap
+
+
+class FrameGrabber:
+
+    def __init__(self, source: str):
+        self.source = source
+
+        # slot = (seq, timestamp, frame)
+        # แทนที่ทั้ง tuple ทีเดียว (atomic) → ผู้อ่านไม่ต้อง lock
+        # cap.read() คืน array ใหม่ทุกครั้ง จึงไม่ต้อง copy
+        self._slot = None
+
+        self._lock = threading.Lock()   # ใช้แค่ตอน start / stop
+        # stop event แยกต่อ thread: thread เก่าที่ยังค้างใน cap.read() (RTSP timeout 10 s)
+        # ตอน close → open ติดกัน จะไม่ถูกปลุกกลับมาเขียน slot ซ้อนกับ thread ใหม่
+        self._stop = None
+        self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """เปิดกล้อง + เริ่ม thread (เปิดอยู่แล้ว → True)"""
+        with self._lock:
+            if self.is_running:
+                return True
+
+            cap = _open_capture(self.source)
+            if not cap.isOpened():
+                cap.release()
+                return False
+
+            self._stop = threading.Event()
+            self._slot = None
+            self._thread = threading.Thread(
+                target=self._loop, args=(cap, self._stop), name="camera-grabber", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self._stop.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+            self._slot = None
+
+    def latest(self):
+        """(seq, timestamp, frame BGR) ล่าสุด หรือ None ถ้ายังไม่มี"""
+        return self._slot
+
+    def _loop(self, cap, stop: threading.Event):
+        seq = 0
+
+        while not stop.is_set():
+            ret, frame = cap.read()
+
+            if stop.is_set():
+                break
+
+            if not ret:
+                print("⚠️ Camera frame lost, reconnecting...")
+                cap.release()
+
+                while not stop.wait(CAMERA_RECONNECT_SECONDS):
+                    cap = _open_capture(self.source)
+                    if cap.isOpened():
+                        print("✅ Camera reconnected")
+                        break
+                    cap.release()
+                continue
+
+            seq += 1
+            self._slot = (seq, time.monotonic(), frame)
+
+        cap.release()
+
+
+camera_grabber = FrameGrabber(CAMERA_SOURCE)
@@ -0,0 +1,230 @@
+# ===============================
+# database/async_client.py
+# ===============================
+# data access แบบ async ใช้ HTTP client ตัวเดียว (connection pool) ร่วมกัน
+# ทั้ง Storage (upload / download / signed URL) และ DB (PostgREST select / insert / rpc)
+# - event loop ของตัวเองใน thread "qc-io" → เรียกได้จากทั้ง worker thread
+#   (call) และ endpoint async (await run_async)
+# - โค้ด sync เรียกผ่าน async_db.call(async_db.select(...)) (ห้ามเรียก call
+#   จาก coroutine บน loop qc-io เอง → deadlock, ใน coroutine ให้ await ตรง ๆ)
+# - งานหลายอย่างยิงพร้อมกันได้ (asyncio.gather) → เวลา network ต่องาน
+#   = round trip ที่นานที่สุด ไม่ใช่ผลรวม
+# ===============================
+
+import asyncio
+import os
+import threading
+from urllib.parse import quote
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+# ===============================
+# DB endpoint (ตาราง + rpc)
+# ===============================
+# ปกติใช้ PostgREST ของ Supabase ({SUPABASE_URL}/rest/v1 + service role key)
+# ตั้ง QC_LOCAL_REST_URL (เช่น http://localhost:3000) เพื่อชี้ไปที่
+# PostgREST + Postgres ในเครื่อง (database/docker-compose.yml) ตอนทดสอบ
+# - role anon ไม่ต้องมี key / ตั้ง QC_LOCAL_REST_KEY ถ้า PostgREST เปิด JWT
+# - ไม่ต้องตั้ง SUPABASE_URL ถ้าใช้คู่กับ QC_STORAGE_BACKEND=local (ไม่ต้องมี network)
+# ===============================
+QC_LOCAL_REST_URL = os.getenv("QC_LOCAL_REST_URL")
+
+if QC_LOCAL_REST_URL:
+    REST_URL = QC_LOCAL_REST_URL
+    REST_KEY = os.getenv("QC_LOCAL_REST_KEY")
+else:
+    REST_URL = f"{SUPABASE_URL}/rest/v1" if SUPABASE_URL else None
+    REST_KEY = SUPABASE_KEY
+
+if not REST_URL:
+    print("⚠️ SUPABASE_URL / QC_LOCAL_REST_URL not set, DB disabled")
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("QC_HTTP_MAX_CONNECTIONS", 20))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("QC_HTTP_TIMEOUT_SECONDS", 30))
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class AsyncSupabase:
+
+    def __init__(self):
+        self.rest_url = REST_URL.rstrip("/") if REST_URL else None
+        self.storage_url = f"{SUPABASE_URL}/storage/v1" if SUPABASE_URL else None
+
+        self._loop = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _auth_headers(self, rest: bool = False) -> dict:
+        key = REST_KEY if rest else SUPABASE_KEY
+        if not key:
+            return {}
+        return {"apikey": key, "Authorization": f"Bearer {key}"}
+
+    # ===============================
+    # Event loop + pooled client
+    # ===============================
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                self._client = httpx.AsyncClient(
+                    http2=_http2_available(),
+                    timeout=HTTP_TIMEOUT_SECONDS,
+                    limits=httpx.Limits(
+                        max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                    ),
+                )
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=run, name="qc-io", daemon=True).start()
+            ready.wait()
+            self._loop = loop
+
+    def submit(self, coro):
+        """ส่ง coroutine เข้า loop ของ qc-io → concurrent.futures.Future"""
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def call(self, coro):
+        """เรียกจาก thread ธรรมดา: รอผลแบบ blocking"""
+        return self.submit(coro).result()
+
+    async def run_async(self, coro):
+        """เรียกจาก endpoint async (คนละ event loop)"""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    # ===============================
+    # DB (PostgREST)
+    # ===============================
+
+    def _rest_endpoint(self, path: str) -> str:
+        if not self.rest_url:
+            raise Exception("SUPABASE_URL / QC_LOCAL_REST_URL not set")
+        return f"{self.rest_url}/{path}"
+
+    async def rpc(self, fn: str, params: dict):
+        res = await self._client.post(
+            self._rest_endpoint(f"rpc/{fn}"),
+            json=params,
+            headers=self._auth_headers(rest=True),
+        )
+
+        if res.status_code >= 400:
+            raise Exception(f"rpc {fn} failed ({res.status_code}): {res.text}")
+
+        return res.json()
+
+    async def _rest(self, method: str, table: str, params=None, json=None, prefer: str | None = None):
+        headers = self._auth_headers(rest=True)
+        if prefer:
+            headers["Prefer"] = prefer
+
+        res = await self._client.request(
+            method, self._rest_endpoint(table), params=params, json=json, headers=headers
+        )
+
+        if res.status_code >= 400:
+            raise Exception(f"{method} {table} failed ({res.status_code}): {res.text}")
+
+        return res.json() if res.content else []
+
+    async def select(self, table: str, params: list[tuple[str, str]]) -> list[dict]:
+        """
+        params: query ของ PostgREST เป็น list (คีย์ซ้ำได้ เช่น created_at=gte / lt)
+        [("select", "id_qc,qc_item(class)"), ("order", "created_at.desc"), ("limit", "50")]
+        """
+        return await self._rest("GET", table, params=params)
+
+    async def insert(self, table: str, rows, on_conflict: str | None = None) -> list[dict]:
+        """insert (หรือ upsert เมื่อมี on_conflict) → rows ที่บันทึก"""
+        prefer = "return=representation"
+        params = None
+        if on_conflict:
+            prefer += ",resolution=merge-duplicates"
+            params = {"on_conflict": on_conflict}
+
+        return await self._rest("POST", table, params=params, json=rows, prefer=prefer)
+
+    async def delete(self, table: str, params: list[tuple[str, str]]):
+        await self._rest("DELETE", table, params=params)
+
+    # ===============================
+    # Storage
+    # ===============================
+
+    def object_url(self, *parts: str) -> str:
+        if not self.storage_url:
+            raise Exception("SUPABASE_URL not set")
+        return "/".join([f"{self.storage_url}/object", *parts])
+
+    async def upload(
+        self, bucket: str, path: str, data: bytes, content_type: str, upsert: bool
+    ) -> str:
+        url = self.object_url(bucket, quote(path))
+
+        headers = {
+            **self._auth_headers(),
+            "content-type": content_type,
+            "x-upsert": "true" if upsert else "false",
+        }
+
+        res = await self._client.post(url, content=data, headers=headers)
+
+        if res.status_code >= 400:
+            raise Exception(f"Upload failed ({res.status_code}): {res.text}")
+
+        return path
+
+    async def download(self, bucket: str, path: str) -> bytes:
+        res = await self._client.get(
+            self.object_url(bucket, quote(path)), headers=self._auth_headers()
+        )
+
+        if res.status_code >= 400:
+            raise Exception(f"Download failed ({res.status_code}): {res.text}")
+
+        return res.content
+
+    async def signed_urls(self, bucket: str, paths: list[str], expires: int) -> dict[str, str]:
+        """เซ็นหลาย path ใน request เดียว → {path: url}"""
+        res = await self._client.post(
+            self.object_url("sign", bucket),
+            json={"expiresIn": expires, "paths": paths},
+            headers=self._auth_headers(),
+        )
+
+        if res.status_code >= 400:
+            raise Exception(f"Create signed urls failed ({res.status_code}): {res.text}")
+
+        urls = {}
+        for item in res.json():
+            # signedURL เป็น path ต่อจาก /storage/v1
+            url = item.get("signedURL") or item.get("signedUrl")
+            if item.get("path") and url and not item.get("error"):
+                urls[item["path"]] = f"{self.storage_url}{url}"
+        return urls
+
+
+async_db = AsyncSupabase()
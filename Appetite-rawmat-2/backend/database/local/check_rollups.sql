@@ -0,0 +1,71 @@
+-- ===============================
+-- ตรวจ rollup (005/006) เทียบกับการคำนวณใหม่ทั้งหมด
+-- ===============================
+-- psql -v ON_ERROR_STOP=1 postgres://qc:qc@localhost:54322/qc -f backend/database/local/check_rollups.sql
+-- ทุกขั้นรันใน transaction เดียวแล้ว rollback → ไม่ทิ้งข้อมูลทดสอบไว้
+-- ไม่ตรง → raise exception (exit code != 0)
+-- ===============================
+
+begin;
+
+create or replace function pg_temp.assert_no_drift(p_step text)
+returns void
+language plpgsql
+as $$
+declare
+    r record;
+    n integer := 0;
+begin
+    for r in select * from qc_rollup_drift() loop
+        n := n + 1;
+        raise warning '% % % % stored=% expected=%',
+            r.tbl, r.period_type, r.period_start, r.class, r.stored, r.expected;
+    end loop;
+    if n > 0 then
+        raise exception '❌ rollup drift หลัง %: % แถว', p_step, n;
+    end if;
+    raise notice '✅ %', p_step;
+end;
+$$;
+
+select pg_temp.assert_no_drift('ก่อนทดสอบ');
+
+-- insert: save_qc_result 2 job (ข้ามวัน)
+select save_qc_result(
+    '{"image_name": "check-a.jpg", "total_count": 10, "status": "PASS", "total_item": 2,
+      "job_id": "rollup-check-a", "created_at": "2031-01-05T10:00:00Z"}',
+    '[{"class": "Potato", "count": 6, "ratio": 0.6},
+      {"class": "Peas",   "count": 4, "ratio": 0.4}]'
+);
+select save_qc_result(
+    '{"image_name": "check-b.jpg", "total_count": 3, "status": "FAIL", "total_item": 1,
+      "job_id": "rollup-check-b", "created_at": "2031-01-06T10:00:00Z"}',
+    '[{"class": "Carrot", "count": 3, "ratio": 1}]'
+);
+select pg_temp.assert_no_drift('insert');
+
+-- retry ของ write-behind: job_id เดิม, items ใหม่
+select save_qc_result(
+    '{"image_name": "check-a.jpg", "total_count": 8, "status": "FAIL", "total_item": 1,
+      "job_id": "rollup-check-a", "created_at": "2031-01-05T10:00:00Z"}',
+    '[{"class": "Potato", "count": 8, "ratio": 1}]'
+);
+select pg_temp.assert_no_drift('upsert job_id ซ้ำ');
+
+-- update: item + ย้าย created_at ข้ามเดือน
+update qc_item set count = 5, ratio = 0.5
+where qc_id = (select id_qc from qc_result where job_id = 'rollup-check-b');
+update qc_result set created_at = '2031-02-01T00:00:00Z', status = 'PASS'
+where job_id = 'rollup-check-b';
+select pg_temp.assert_no_drift('update');
+
+-- delete: item ตรง ๆ และ qc_result (cascade ไป qc_item)
+delete from qc_item
+where qc_id = (select id_qc from qc_result where job_id = 'rollup-check-a');
+delete from qc_result where job_id = 'rollup-check-b';
+select pg_temp.assert_no_drift('delete');
+
+delete from qc_result where job_id = 'rollup-check-a';
+select pg_temp.assert_no_drift('delete ทั้งหมด');
+
+rollback;
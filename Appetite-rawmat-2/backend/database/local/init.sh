@@ -0,0 +1,23 @@
+#!/bin/sh
+# ===============================
+# init Postgres ในเครื่อง (รันครั้งแรกที่ volume ว่าง)
+# - apply migrations ทั้งหมดตามลำดับชื่อไฟล์
+# - สร้าง role ที่ PostgREST ใช้ (บน Supabase มีอยู่แล้ว ไม่ต้องรันไฟล์นี้)
+# ===============================
+set -e
+
+for f in /migrations/*.sql; do
+    echo "apply $f"
+    psql -v ON_ERROR_STOP=1 -U "$POSTGRES_USER" -d "$POSTGRES_DB" -f "$f"
+done
+
+psql -v ON_ERROR_STOP=1 -U "$POSTGRES_USER" -d "$POSTGRES_DB" <<'SQL'
+create role anon nologin;
+grant usage on schema public to anon;
+grant all on all tables in schema public to anon;
+grant all on all sequences in schema public to anon;
+grant execute on all functions in schema public to anon;
+alter default privileges in schema public grant all on tables to anon;
+alter default privileges in schema public grant all on sequences to anon;
+alter default privileges in schema public grant execute on functions to anon;
+SQL
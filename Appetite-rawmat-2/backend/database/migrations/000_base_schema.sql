@@ -0,0 +1,26 @@
+-- ===============================
+-- 000: ตารางหลักของ QC
+-- ===============================
+-- บน Supabase ตารางนี้มีอยู่แล้ว (if not exists → ไม่ทำอะไร)
+-- ใช้สร้าง schema ให้ Postgres ในเครื่อง (database/docker-compose.yml)
+-- ===============================
+
+create table if not exists qc_result (
+    id_qc       bigint generated by default as identity primary key,
+    image_name  text not null,
+    total_count integer not null default 0,
+    status      text not null,
+    total_item  integer not null default 0,
+    created_at  timestamptz not null default now()
+);
+
+create table if not exists qc_item (
+    id      bigint generated by default as identity primary key,
+    qc_id   bigint not null references qc_result (id_qc) on delete cascade,
+    class   text not null,
+    count   integer not null default 0,
+    ratio   numeric not null default 0
+);
+
+create index if not exists qc_item_qc_id_idx
+    on qc_item (qc_id);
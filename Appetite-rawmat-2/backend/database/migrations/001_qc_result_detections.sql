@@ -0,0 +1,18 @@
+-- ===============================
+-- 001: เก็บ detections ไว้กับ qc_result
+-- ===============================
+-- overlay ไม่ถูก render/upload ตอน QC แล้ว
+-- GET /qc/{id}/overlay จะวาดจาก detections นี้ตอนมีคนเปิดดูครั้งแรก
+--
+-- รูปแบบ:
+-- {
+--   "image_size": [w, h],
+--   "models": {
+--     "Potato": {"xyxy": [[x1, y1, x2, y2], ...], "conf": [0.91, ...]},
+--     ...
+--   }
+-- }
+-- ===============================
+
+alter table qc_result
+    add column if not exists detections jsonb;
@@ -0,0 +1,13 @@
+-- ===============================
+-- 002: job_id ของงาน write-behind
+-- ===============================
+-- /qc ตอบ client ทันทีด้วย job_id (provisional id)
+-- แล้วค่อย upload + insert เบื้องหลัง
+-- unique → retry ใช้ upsert on_conflict=job_id ได้โดยไม่เกิด row ซ้ำ
+-- ===============================
+
+alter table qc_result
+    add column if not exists job_id text;
+
+create unique index if not exists qc_result_job_id_key
+    on qc_result (job_id);
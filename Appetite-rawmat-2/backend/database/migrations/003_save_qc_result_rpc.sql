@@ -0,0 +1,50 @@
+-- ===============================
+-- 003: save_qc_result ใน round trip เดียว
+-- ===============================
+-- เขียน qc_result + qc_item ทั้งหมดใน transaction เดียว
+-- เรียกจาก qc_service.save_qc_result (QC_SAVE_MODE=rpc):
+--   db.rpc("save_qc_result", {"p_header": {...}, "p_items": [...]})
+--
+-- p_header: คอลัมน์ของ qc_result (image_name, total_count, status,
+--           total_item, detections, job_id, created_at)
+-- p_items : [{"class", "count", "ratio"}, ...]
+-- job_id ซ้ำ (retry ของ write-behind) → อัปเดต header เดิม + เขียน items ใหม่
+-- return  : {"id_qc", "created_at"}
+-- ===============================
+
+create or replace function save_qc_result(p_header jsonb, p_items jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_row qc_result%rowtype;
+begin
+    insert into qc_result (
+        image_name, total_count, status, total_item, detections, job_id, created_at
+    )
+    select
+        h.image_name,
+        h.total_count,
+        h.status,
+        h.total_item,
+        h.detections,
+        h.job_id,
+        coalesce(h.created_at, now())
+    from jsonb_populate_record(null::qc_result, p_header) h
+    on conflict (job_id) do update set
+        image_name  = excluded.image_name,
+        total_count = excluded.total_count,
+        status      = excluded.status,
+        total_item  = excluded.total_item,
+        detections  = excluded.detections
+    returning * into v_row;
+
+    delete from qc_item where qc_id = v_row.id_qc;
+
+    insert into qc_item (qc_id, "class", "count", ratio)
+    select v_row.id_qc, i."class", i."count", i.ratio
+    from jsonb_populate_recordset(null::qc_item, coalesce(p_items, '[]'::jsonb)) i;
+
+    return jsonb_build_object('id_qc', v_row.id_qc, 'created_at', v_row.created_at);
+end;
+$$;
@@ -0,0 +1,9 @@
+-- ===============================
+-- 004: index สำหรับ /qc/history (keyset pagination)
+-- ===============================
+-- เรียง + seek ด้วย (created_at, id_qc) → อ่านแค่ทีละหน้า
+-- ไม่ว่าช่วงเวลาจะยาวแค่ไหน
+-- ===============================
+
+create index if not exists qc_result_created_at_id_idx
+    on qc_result (created_at desc, id_qc desc);
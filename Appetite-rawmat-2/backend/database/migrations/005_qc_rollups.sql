@@ -0,0 +1,186 @@
+-- ===============================
+-- 005: rollup รายวัน / สัปดาห์ / เดือน / ปี สำหรับ /qc/stats
+-- ===============================
+-- อัปเดตแบบ incremental ด้วย trigger ทุกครั้งที่ save_qc_result เขียน
+-- (ทั้ง QC_SAVE_MODE=rpc และ bulk)
+-- - insert qc_result / qc_item → บวกเข้า rollup
+-- - delete / update            → หักของเดิมออกก่อน
+-- retry ของ write-behind (upsert job_id + เขียน items ใหม่) จึงไม่นับซ้ำ
+--
+-- period_start = date_trunc(period, created_at) ตาม timezone ของ DB (UTC)
+-- week เริ่มวันจันทร์ ตรงกับ calc_date_range ใน main.py
+-- ===============================
+
+create table if not exists qc_rollup (
+    period_type     text not null check (period_type in ('day', 'week', 'month', 'year')),
+    period_start    timestamptz not null,
+    inspections     integer not null default 0,
+    pass_count      integer not null default 0,
+    fail_count      integer not null default 0,
+    total_count_sum bigint not null default 0,
+    primary key (period_type, period_start)
+);
+
+create table if not exists qc_rollup_item (
+    period_type  text not null,
+    period_start timestamptz not null,
+    class        text not null,
+    samples      integer not null default 0,
+    count_sum    bigint not null default 0,
+    ratio_sum    numeric not null default 0,
+    primary key (period_type, period_start, class),
+    foreign key (period_type, period_start)
+        references qc_rollup (period_type, period_start) on delete cascade
+);
+
+-- ===============================
+-- ช่วงเวลาทั้งหมดที่ 1 record ตกอยู่
+-- ===============================
+create or replace function qc_rollup_periods(p_ts timestamptz)
+returns table (period_type text, period_start timestamptz)
+language sql
+stable
+as $$
+    values
+        ('day',   date_trunc('day',   p_ts)),
+        ('week',  date_trunc('week',  p_ts)),
+        ('month', date_trunc('month', p_ts)),
+        ('year',  date_trunc('year',  p_ts))
+$$;
+
+-- ===============================
+-- บวก / หัก header 1 record (p_sign = 1 / -1)
+-- ===============================
+create or replace function qc_rollup_apply_result(
+    p_created_at timestamptz, p_status text, p_total_count integer, p_sign integer
+)
+returns void
+language sql
+as $$
+    insert into qc_rollup as r (
+        period_type, period_start, inspections, pass_count, fail_count, total_count_sum
+    )
+    select
+        p.period_type,
+        p.period_start,
+        p_sign,
+        case when p_status = 'PASS' then p_sign else 0 end,
+        case when p_status = 'PASS' then 0 else p_sign end,
+        p_sign * coalesce(p_total_count, 0)
+    from qc_rollup_periods(p_created_at) p
+    on conflict (period_type, period_start) do update set
+        inspections     = r.inspections     + excluded.inspections,
+        pass_count      = r.pass_count      + excluded.pass_count,
+        fail_count      = r.fail_count      + excluded.fail_count,
+        total_count_sum = r.total_count_sum + excluded.total_count_sum;
+$$;
+
+-- ===============================
+-- บวก / หัก item 1 แถว
+-- ===============================
+create or replace function qc_rollup_apply_item(
+    p_created_at timestamptz, p_class text, p_count integer, p_ratio numeric, p_sign integer
+)
+returns void
+language sql
+as $$
+    insert into qc_rollup_item as r (
+        period_type, period_start, class, samples, count_sum, ratio_sum
+    )
+    select
+        p.period_type,
+        p.period_start,
+        p_class,
+        p_sign,
+        p_sign * coalesce(p_count, 0),
+        p_sign * coalesce(p_ratio, 0)
+    from qc_rollup_periods(p_created_at) p
+    on conflict (period_type, period_start, class) do update set
+        samples   = r.samples   + excluded.samples,
+        count_sum = r.count_sum + excluded.count_sum,
+        ratio_sum = r.ratio_sum + excluded.ratio_sum;
+$$;
+
+-- ===============================
+-- triggers
+-- ===============================
+create or replace function qc_result_rollup_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform qc_rollup_apply_result(old.created_at, old.status, old.total_count, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform qc_rollup_apply_result(new.created_at, new.status, new.total_count, 1);
+    end if;
+    return null;
+end;
+$$;
+
+create or replace function qc_item_rollup_trigger()
+returns trigger
+language plpgsql
+as $$
+declare
+    v_created_at timestamptz;
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        select created_at into v_created_at from qc_result where id_qc = old.qc_id;
+        -- parent ถูกลบไปแล้ว (cascade) → ข้าม
+        if found then
+            perform qc_rollup_apply_item(v_created_at, old.class, old.count, old.ratio, -1);
+        end if;
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        select created_at into v_created_at from qc_result where id_qc = new.qc_id;
+        perform qc_rollup_apply_item(v_created_at, new.class, new.count, new.ratio, 1);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists qc_result_rollup on qc_result;
+create trigger qc_result_rollup
+    after insert or delete or update of created_at, status, total_count on qc_result
+    for each row execute function qc_result_rollup_trigger();
+
+drop trigger if exists qc_item_rollup on qc_item;
+create trigger qc_item_rollup
+    after insert or delete or update on qc_item
+    for each row execute function qc_item_rollup_trigger();
+
+-- ===============================
+-- backfill จากข้อมูลเดิม
+-- ===============================
+truncate qc_rollup cascade;
+
+insert into qc_rollup (
+    period_type, period_start, inspections, pass_count, fail_count, total_count_sum
+)
+select
+    p.period_type,
+    p.period_start,
+    count(*),
+    count(*) filter (where q.status = 'PASS'),
+    count(*) filter (where q.status <> 'PASS'),
+    coalesce(sum(q.total_count), 0)
+from qc_result q
+cross join lateral qc_rollup_periods(q.created_at) p
+group by p.period_type, p.period_start;
+
+insert into qc_rollup_item (
+    period_type, period_start, class, samples, count_sum, ratio_sum
+)
+select
+    p.period_type,
+    p.period_start,
+    i.class,
+    count(*),
+    coalesce(sum(i.count), 0),
+    coalesce(sum(i.ratio), 0)
+from qc_item i
+join qc_result q on q.id_qc = i.qc_id
+cross join lateral qc_rollup_periods(q.created_at) p
+group by p.period_type, p.period_start, i.class;
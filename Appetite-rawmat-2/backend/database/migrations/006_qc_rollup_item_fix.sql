@@ -0,0 +1,175 @@
+-- ===============================
+-- 006: แก้ rollup ของ qc_item ไม่ตรงกับข้อมูลจริง
+-- ===============================
+-- 005 หัก item ใน qc_item_rollup_trigger โดยหา created_at จาก parent
+-- - ลบ qc_result → qc_item ถูกลบตาม (cascade) ตอน parent หายไปแล้ว
+--   → trigger ของ item หา parent ไม่เจอ → ไม่หัก → qc_rollup_item ค้าง
+-- - แก้ created_at ของ qc_result → rollup ของ header ย้ายช่วง แต่ item ไม่ย้าย
+--
+-- แก้: ให้ qc_result ดูแล item ของตัวเองในสองกรณีนี้
+-- - BEFORE DELETE บน qc_result: หัก item ทั้งหมดขณะ parent ยังอ่านได้
+--   (cascade ตามมาทีหลัง → trigger ของ item หา parent ไม่เจอ → ข้าม ไม่หักซ้ำ)
+-- - UPDATE created_at: ย้าย item จากช่วงเดิมไปช่วงใหม่
+-- แล้ว backfill ใหม่ทั้งหมด (ล้างค่าที่ค้างจาก 005)
+--
+-- ตรวจ: select * from qc_rollup_drift();  → ต้องไม่มีแถว
+--       database/local/check_rollups.sql   → insert / update / delete แล้วตรวจ (rollback)
+-- ===============================
+
+-- ===============================
+-- บวก / หัก item ทั้งหมดของ 1 record
+-- ===============================
+create or replace function qc_rollup_apply_items(
+    p_qc_id bigint, p_created_at timestamptz, p_sign integer
+)
+returns void
+language plpgsql
+as $$
+declare
+    r record;
+begin
+    for r in select class, count, ratio from qc_item where qc_id = p_qc_id loop
+        perform qc_rollup_apply_item(p_created_at, r.class, r.count, r.ratio, p_sign);
+    end loop;
+end;
+$$;
+
+-- ===============================
+-- triggers
+-- ===============================
+create or replace function qc_result_rollup_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform qc_rollup_apply_result(old.created_at, old.status, old.total_count, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform qc_rollup_apply_result(new.created_at, new.status, new.total_count, 1);
+    end if;
+    -- ย้ายช่วงเวลา → item ย้ายตาม
+    if tg_op = 'UPDATE' and old.created_at is distinct from new.created_at then
+        perform qc_rollup_apply_items(new.id_qc, old.created_at, -1);
+        perform qc_rollup_apply_items(new.id_qc, new.created_at, 1);
+    end if;
+    return null;
+end;
+$$;
+
+create or replace function qc_result_rollup_items_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- ก่อน cascade: item ยังอยู่ + รู้ created_at ของ parent
+    perform qc_rollup_apply_items(old.id_qc, old.created_at, -1);
+    return old;
+end;
+$$;
+
+drop trigger if exists qc_result_rollup_items on qc_result;
+create trigger qc_result_rollup_items
+    before delete on qc_result
+    for each row execute function qc_result_rollup_items_trigger();
+
+-- ===============================
+-- rollup ที่ควรเป็น (คำนวณใหม่จาก qc_result / qc_item)
+-- ===============================
+create or replace function qc_rollup_expected()
+returns setof qc_rollup
+language sql
+stable
+as $$
+    select
+        p.period_type,
+        p.period_start,
+        count(*)::integer,
+        (count(*) filter (where q.status = 'PASS'))::integer,
+        (count(*) filter (where q.status <> 'PASS'))::integer,
+        coalesce(sum(q.total_count), 0)
+    from qc_result q
+    cross join lateral qc_rollup_periods(q.created_at) p
+    group by p.period_type, p.period_start
+$$;
+
+create or replace function qc_rollup_item_expected()
+returns setof qc_rollup_item
+language sql
+stable
+as $$
+    select
+        p.period_type,
+        p.period_start,
+        i.class,
+        count(*)::integer,
+        coalesce(sum(i.count), 0),
+        coalesce(sum(i.ratio), 0)
+    from qc_item i
+    join qc_result q on q.id_qc = i.qc_id
+    cross join lateral qc_rollup_periods(q.created_at) p
+    group by p.period_type, p.period_start, i.class
+$$;
+
+-- ===============================
+-- แถวที่ rollup ไม่ตรงกับที่คำนวณใหม่ (ว่าง = ถูกต้อง)
+-- แถวที่เหลือ 0 หลังหัก (ไม่มีข้อมูลแล้ว) ถือว่าตรงกับ "ไม่มีแถว"
+-- ===============================
+create or replace function qc_rollup_drift()
+returns table (
+    tbl          text,
+    period_type  text,
+    period_start timestamptz,
+    class        text,
+    stored       text,
+    expected     text
+)
+language sql
+stable
+as $$
+    select
+        'qc_rollup',
+        coalesce(s.period_type, e.period_type),
+        coalesce(s.period_start, e.period_start),
+        null::text,
+        format('%s/%s/%s/%s', coalesce(s.inspections, 0), coalesce(s.pass_count, 0),
+               coalesce(s.fail_count, 0), coalesce(s.total_count_sum, 0)),
+        format('%s/%s/%s/%s', coalesce(e.inspections, 0), coalesce(e.pass_count, 0),
+               coalesce(e.fail_count, 0), coalesce(e.total_count_sum, 0))
+    from qc_rollup s
+    full join qc_rollup_expected() e
+        on e.period_type = s.period_type and e.period_start = s.period_start
+    where (coalesce(s.inspections, 0), coalesce(s.pass_count, 0),
+           coalesce(s.fail_count, 0), coalesce(s.total_count_sum, 0))
+       is distinct from
+          (coalesce(e.inspections, 0), coalesce(e.pass_count, 0),
+           coalesce(e.fail_count, 0), coalesce(e.total_count_sum, 0))
+
+    union all
+
+    select
+        'qc_rollup_item',
+        coalesce(s.period_type, e.period_type),
+        coalesce(s.period_start, e.period_start),
+        coalesce(s.class, e.class),
+        format('%s/%s/%s', coalesce(s.samples, 0), coalesce(s.count_sum, 0),
+               coalesce(s.ratio_sum, 0)),
+        format('%s/%s/%s', coalesce(e.samples, 0), coalesce(e.count_sum, 0),
+               coalesce(e.ratio_sum, 0))
+    from qc_rollup_item s
+    full join qc_rollup_item_expected() e
+        on e.period_type = s.period_type
+       and e.period_start = s.period_start
+       and e.class = s.class
+    where (coalesce(s.samples, 0), coalesce(s.count_sum, 0), coalesce(s.ratio_sum, 0))
+       is distinct from
+          (coalesce(e.samples, 0), coalesce(e.count_sum, 0), coalesce(e.ratio_sum, 0))
+$$;
+
+-- ===============================
+-- backfill ใหม่ (ค่าที่ค้างจาก trigger ของ 005)
+-- ===============================
+truncate qc_rollup cascade;
+
+insert into qc_rollup select * from qc_rollup_expected();
+insert into qc_rollup_item select * from qc_rollup_item_expected();
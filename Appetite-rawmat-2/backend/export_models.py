@@ -0,0 +1,218 @@
+# ===============================
+# export_models.py
+# ===============================
+# export โมเดล QC (.pt) → ONNX / OpenVINO IR สำหรับเครื่อง CPU
+# - ไฟล์ที่ได้วางข้าง .pt ตามชื่อที่ model_registry หาเจอเอง
+#   potato.pt → potato.onnx / potato_openvino_model/
+# - --verify: เทียบผลกับ PyTorch บนภาพ valid ต้องตรงกันภายใน tolerance
+#
+# ใช้งาน:
+#   python export_models.py --format onnx --verify
+#   python export_models.py --format openvino --models Potato Peas
+#   QC_BACKEND=onnx uvicorn main:app
+# ===============================
+
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+from ultralytics import YOLO
+
+from model_registry import MODEL_CONFIG_PATH, exported_path, load_model_configs
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_DIR = os.path.dirname(BASE_DIR)
+
+# โมเดล segmentation ที่เทรนจาก train.py (imgsz ตาม args.yaml)
+SEG_MODEL_PATH = os.path.join(
+    DATASET_DIR, "food_qc_yolo11", "seg_model_v1_accuracy", "weights", "best.pt"
+)
+SEG_MODEL_IMGSZ = 512
+
+VERIFY_DIR = os.path.join(DATASET_DIR, "valid", "images")
+
+
+# ===============================
+# Targets
+# ===============================
+
+def collect_targets(names: list[str] | None, default_imgsz: int) -> list[dict]:
+    configs, options = load_model_configs(MODEL_CONFIG_PATH)
+    imgsz = default_imgsz or int(options.get("warmup_imgsz", 640))
+
+    targets = [
+        {
+            "name": name,
+            "path": cfg["path"],
+            "task": cfg.get("task"),
+            "imgsz": int(cfg.get("imgsz") or imgsz),
+            "dataset_class": cfg.get("dataset_class"),
+        }
+        for name, cfg in configs.items()
+        if not names or name in names
+    ]
+
+    if (not names or "seg_model_v1_accuracy" in names) and os.path.exists(SEG_MODEL_PATH):
+        targets.append({
+            "name": "seg_model_v1_accuracy",
+            "path": SEG_MODEL_PATH,
+            "task": "segment",
+            "imgsz": default_imgsz or SEG_MODEL_IMGSZ,
+            "dataset_class": None,   # หลาย class ตาม data.yaml
+        })
+
+    return targets
+
+
+# ===============================
+# Export
+# ===============================
+
+def export_one(target: dict, fmt: str) -> str:
+    model = YOLO(target["path"], task=target["task"])
+
+    # dynamic=True → รับ batch หลายภาพได้เหมือน .pt (run_qc_batch)
+    kwargs = {"format": fmt, "imgsz": target["imgsz"], "dynamic": True}
+    if fmt == "onnx":
+        kwargs["simplify"] = True
+
+    out = model.export(**kwargs)
+
+    expected = exported_path(target["path"], fmt)
+    if os.path.abspath(str(out)) != os.path.abspath(expected):
+        print(f"⚠️ exported to {out} (registry expects {expected})")
+
+    return str(out)
+
+
+# ===============================
+# Verify (parity vs PyTorch)
+# ===============================
+
+def _iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU ระหว่างกล่อง xyxy ทุกคู่ (N, M)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _match(ref: np.ndarray, other: np.ndarray, iou_thr: float) -> list[float]:
+    """จับคู่กล่องแบบ greedy ตาม IoU สูงสุด → list IoU ของคู่ที่จับได้"""
+    iou = _iou_matrix(ref, other)
+    matched = []
+
+    while iou.size and iou.max() >= iou_thr:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        matched.append(float(iou[i, j]))
+        iou[i, :] = -1
+        iou[:, j] = -1
+
+    return matched
+
+
+def verify_one(target: dict, exported: str, images: list[str], args) -> bool:
+    ref_model = YOLO(target["path"], task=target["task"])
+    exp_model = YOLO(exported, task=target["task"])
+
+    count_diffs = []
+    ious = []
+    unmatched = 0
+    total = 0
+
+    for path in images:
+        ref = ref_model(path, imgsz=target["imgsz"], conf=args.conf, verbose=False)[0]
+        exp = exp_model(path, imgsz=target["imgsz"], conf=args.conf, verbose=False)[0]
+
+        ref_boxes = ref.boxes.xyxy.cpu().numpy()
+        exp_boxes = exp.boxes.xyxy.cpu().numpy()
+
+        matched = _match(ref_boxes, exp_boxes, args.iou)
+
+        count_diffs.append(abs(len(ref_boxes) - len(exp_boxes)) / max(1, len(ref_boxes)))
+        ious.extend(matched)
+        unmatched += len(ref_boxes) - len(matched)
+        total += len(ref_boxes)
+
+    max_count_diff = max(count_diffs) if count_diffs else 0.0
+    mean_iou = float(np.mean(ious)) if ious else 1.0
+    match_rate = 1 - unmatched / total if total else 1.0
+
+    ok = (
+        max_count_diff <= args.count_tol
+        and mean_iou >= args.min_iou
+        and match_rate >= args.min_match
+    )
+
+    print(
+        f"{'✅' if ok else '❌'} {target['name']}: "
+        f"max count diff {max_count_diff:.1%} | mean IoU {mean_iou:.3f} | "
+        f"matched {match_rate:.1%} of {total} boxes ({len(images)} images)"
+    )
+    return ok
+
+
+# ===============================
+# Main
+# ===============================
+
+def main():
+    parser = argparse.ArgumentParser(description="Export QC models for CPU inference")
+    parser.add_argument("--format", choices=["onnx", "openvino"], default="onnx")
+    parser.add_argument("--imgsz", type=int, default=0, help="0 = imgsz ใน models.yaml")
+    parser.add_argument("--models", nargs="*", help="ชื่อโมเดล (ค่าเริ่มต้น: ทั้งหมด)")
+
+    parser.add_argument("--verify", action="store_true", help="เทียบผลกับ PyTorch")
+    parser.add_argument("--images", default=VERIFY_DIR)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU ขั้นต่ำที่นับว่าเป็นกล่องเดียวกัน")
+    parser.add_argument("--count-tol", type=float, default=0.05, help="ต่างของจำนวนต่อภาพได้ไม่เกิน (สัดส่วน)")
+    parser.add_argument("--min-iou", type=float, default=0.9)
+    parser.add_argument("--min-match", type=float, default=0.95)
+    args = parser.parse_args()
+
+    targets = collect_targets(args.models, args.imgsz)
+    if not targets:
+        print("❌ No models to export")
+        sys.exit(1)
+
+    images = sorted(glob.glob(os.path.join(args.images, "*.jpg")))[: args.limit]
+    if args.verify and not images:
+        print(f"❌ No verify images in {args.images}")
+        sys.exit(1)
+
+    failed = []
+
+    for target in targets:
+        if not os.path.exists(target["path"]):
+            print(f"❌ {target['name']}: {target['path']} not found")
+            failed.append(target["name"])
+            continue
+
+        print(f"📦 Exporting {target['name']} → {args.format} (imgsz {target['imgsz']})")
+        exported = export_one(target, args.format)
+
+        if args.verify and not verify_one(target, exported, images, args):
+            failed.append(target["name"])
+
+    if failed:
+        print("❌ Failed:", ", ".join(failed))
+        sys.exit(1)
+
+    print(f"✅ Done. Run the backend with QC_BACKEND={args.format}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# ===============================
+# imaging.py
+# ===============================
+# decode / encode ภาพจุดเดียวของทั้ง backend
+# - decode ครั้งเดียว (จัดการ EXIF orientation ที่นี่ที่เดียว)
+# - ภายใน pipeline ส่งต่อเป็น numpy BGR (แบบ cv2)
+# - encode JPEG / PNG เฉพาะตอนจะเก็บไฟล์จริงเท่านั้น
+# ===============================
+
+import io
+import os
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+JPEG_QUALITY = int(os.getenv("QC_JPEG_QUALITY", 90))
+
+# ด้านสั้นขั้นต่ำตอน decode JPEG สำหรับ inference (ใกล้ imgsz ของโมเดล)
+# 0 = decode เต็มความละเอียด
+DECODE_SIZE = int(os.getenv("QC_DECODE_SIZE", 640))
+
+# EXIF orientation ที่หมุน 90° (กว้าง / สูงสลับกัน)
+_EXIF_ORIENTATION = 0x0112
+_ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def decode_image(image_bytes: bytes) -> np.ndarray:
+    """
+    bytes (jpg/png/...) → numpy BGR uint8
+    หมุนภาพตาม EXIF orientation ให้แล้ว
+    """
+    pil_img = Image.open(io.BytesIO(image_bytes))
+    pil_img = ImageOps.exif_transpose(pil_img)
+
+    if pil_img.mode != "RGB":
+        pil_img = pil_img.convert("RGB")
+
+    # RGB → BGR โดยไม่ copy เพิ่ม (cvtColor เขียนลง buffer ใหม่ครั้งเดียว)
+    return cv2.cvtColor(np.asarray(pil_img), cv2.COLOR_RGB2BGR)
+
+
+def decode_image_reduced(image_bytes: bytes, target: int = DECODE_SIZE) -> tuple[np.ndarray, bool]:
+    """
+    decode สำหรับ inference: JPEG ใช้ DCT scaling (PIL draft) ย่อ 1/2, 1/4, 1/8
+    ระหว่าง decode เลย → ไม่ต้อง decode 12 MP เต็มแล้วให้ YOLO ย่อเหลือ 640 อีกที
+    - ภาพที่ได้ยังใหญ่กว่าหรือเท่ากับ target ทั้ง 2 ด้าน (YOLO letterbox ต่อเอง)
+    - ไฟล์อื่น (png, webp, ...) decode เต็มเหมือน decode_image
+    return: (numpy BGR, เป็น JPEG หรือไม่)
+    """
+    pil_img = Image.open(io.BytesIO(image_bytes))
+    is_jpeg = pil_img.format == "JPEG"
+
+    if is_jpeg and target:
+        # ขนาดที่ขอเป็นขนาดหลังหมุนตาม EXIF → ขอด้านละ target ใช้ได้ทั้ง 2 แนว
+        pil_img.draft("RGB", (target, target))
+
+    pil_img = ImageOps.exif_transpose(pil_img)
+
+    if pil_img.mode != "RGB":
+        pil_img = pil_img.convert("RGB")
+
+    return cv2.cvtColor(np.asarray(pil_img), cv2.COLOR_RGB2BGR), is_jpeg
+
+
+def make_thumbnail(image_bytes: bytes, size: int, fmt: str = "webp") -> bytes:
+    """
+    ภาพย่อด้านยาวไม่เกิน size (decode แบบย่อด้วย draft แล้ว INTER_AREA)
+    ภาพที่เล็กกว่านั้นอยู่แล้วไม่ขยาย แค่ encode ใหม่
+    """
+    thumb, _ = decode_image_reduced(image_bytes, size)
+
+    scale = size / max(thumb.shape[:2])
+    if scale < 1:
+        thumb = cv2.resize(
+            thumb,
+            (max(1, round(thumb.shape[1] * scale)), max(1, round(thumb.shape[0] * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    if fmt == "webp":
+        return encode_webp(thumb, 80)
+    return encode_jpeg(thumb, 80)
+
+
+def oriented_size(image_bytes: bytes) -> tuple[int, int]:
+    """(w, h) เต็มความละเอียดหลังหมุนตาม EXIF อ่านจาก header อย่างเดียว ไม่ decode"""
+    pil_img = Image.open(io.BytesIO(image_bytes))
+    w, h = pil_img.size
+
+    if pil_img.getexif().get(_EXIF_ORIENTATION, 1) in _ROTATED_ORIENTATIONS:
+        return h, w
+    return w, h
+
+
+def to_bgr(img: np.ndarray, is_rgb: bool = False) -> np.ndarray:
+    """รับ ndarray RGB หรือ BGR แล้วคืน BGR 3 channel"""
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] == 4:
+        return cv2.cvtColor(img, cv2.COLOR_RGBA2BGR if is_rgb else cv2.COLOR_BGRA2BGR)
+    if is_rgb:
+        return cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+    return img
+
+
+def encode_jpeg(img: np.ndarray, quality: int = JPEG_QUALITY) -> bytes:
+    """numpy BGR → JPEG bytes"""
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise Exception("JPEG encode failed")
+    return buf.tobytes()
+
+
+def encode_png(img: np.ndarray) -> bytes:
+    """numpy BGR → PNG bytes"""
+    ok, buf = cv2.imencode(".png", img)
+    if not ok:
+        raise Exception("PNG encode failed")
+    return buf.tobytes()
+
+
+def encode_webp(img: np.ndarray, quality: int = 85) -> bytes:
+    """numpy BGR → WEBP bytes"""
+    ok, buf = cv2.imencode(".webp", img, [cv2.IMWRITE_WEBP_QUALITY, quality])
+    if not ok:
+        raise Exception("WEBP encode failed")
+    return buf.tobytes()
@@ -0,0 +1,192 @@
+# ===============================
+# inference_pool.py
+# ===============================
+# worker pool สำหรับงาน inference (run_qc) หลังคิวแบบจำกัดขนาด
+# - งานมี priority: upload มือ > กล้องกด capture > frame จาก stream
+# - คิวเต็ม → ไล่งาน priority ต่ำสุด (ใหม่สุด) ออกให้งานที่สำคัญกว่า
+#   ไม่มีงานที่ต่ำกว่า → QueueFull ทันที (endpoint ตอบ 503 + Retry-After)
+# - เก็บสถิติ queue depth / wait time ไว้ดูที่ /qc/queue
+# ===============================
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+PRIORITY_MANUAL = 0
+PRIORITY_CAMERA = 1
+PRIORITY_STREAM = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_MANUAL: "manual",
+    PRIORITY_CAMERA: "camera",
+    PRIORITY_STREAM: "stream",
+}
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+
+        self._queue = queue.PriorityQueue(maxsize=self.max_queue)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+        # สถิติ (อัปเดตภายใต้ _lock)
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = {name: 0 for name in PRIORITY_NAMES.values()}
+        self._wait_last = 0.0
+        self._wait_max = 0.0
+        self._wait_avg = 0.0      # EMA
+        self._service_avg = 0.0   # EMA ของเวลา run งาน
+
+        for i in range(self.workers):
+            threading.Thread(
+                target=self._worker, name=f"qc-infer-{i}", daemon=True
+            ).start()
+
+    # ===============================
+    # Submit
+    # ===============================
+
+    def submit(self, fn, *args, priority: int = PRIORITY_MANUAL, **kwargs) -> Future:
+        """
+        ส่งงานเข้าคิว → concurrent Future
+        raise QueueFull ถ้าคิวเต็มและไม่มีงาน priority ต่ำกว่าให้ไล่ออก
+        """
+        fut = Future()
+        item = (priority, next(self._seq), time.monotonic(), fn, args, kwargs, fut)
+
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            evicted = self._evict_for(item)
+            if evicted is None:
+                self._count_rejected(priority)
+                raise QueueFull(self.retry_after())
+
+            # งานที่ถูกไล่ได้ QueueFull ผ่าน future ของมัน (เหมือนโดนปฏิเสธตอน submit)
+            self._count_rejected(evicted[0])
+            evicted_fut = evicted[-1]
+            if evicted_fut.set_running_or_notify_cancel():
+                evicted_fut.set_exception(QueueFull(self.retry_after()))
+
+        return fut
+
+    def _evict_for(self, item: tuple) -> tuple | None:
+        """
+        คิวเต็ม: เอางาน priority ต่ำสุด (ถ้าเท่ากัน = ใหม่สุด) ออกแล้วใส่ item แทน
+        return งานที่ถูกไล่ / None ถ้าไม่มีงานที่ priority ต่ำกว่า item
+        """
+        q = self._queue
+        with q.mutex:
+            if not q.queue:
+                return None
+
+            victim_idx = max(range(len(q.queue)), key=lambda i: q.queue[i][:2])
+            victim = q.queue[victim_idx]
+            if victim[0] <= item[0]:
+                return None
+
+            # สลับ 1 ออก 1 เข้า → ขนาดคิว / unfinished_tasks เท่าเดิม
+            q.queue[victim_idx] = item
+            heapq.heapify(q.queue)
+            q.not_empty.notify()
+
+        return victim
+
+    def _count_rejected(self, priority: int):
+        key = PRIORITY_NAMES.get(priority, str(priority))
+        with self._lock:
+            self._rejected[key] = self._rejected.get(key, 0) + 1
+
+    async def run(self, fn, *args, priority: int = PRIORITY_MANUAL, **kwargs):
+        """submit แล้ว await ผลจาก event loop โดยไม่ block"""
+        return await asyncio.wrap_future(
+            self.submit(fn, *args, priority=priority, **kwargs)
+        )
+
+    def retry_after(self) -> int:
+        """ประมาณเวลาที่คิวจะว่าง (วินาที, อย่างน้อย 1)"""
+        with self._lock:
+            backlog = self._queue.qsize() + self._in_flight
+            service = self._service_avg or 1.0
+        return max(1, math.ceil(backlog * service / self.workers))
+
+    # ===============================
+    # Worker
+    # ===============================
+
+    def _worker(self):
+        while True:
+            priority, _, enqueued_at, fn, args, kwargs, fut = self._queue.get()
+
+            if not fut.set_running_or_notify_cancel():
+                self._queue.task_done()
+                continue
+
+            started = time.monotonic()
+            wait = started - enqueued_at
+
+            with self._lock:
+                self._in_flight += 1
+                self._wait_last = wait
+                self._wait_max = max(self._wait_max, wait)
+                self._wait_avg = wait if not self._completed else (
+                    0.9 * self._wait_avg + 0.1 * wait
+                )
+
+            try:
+                fut.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                fut.set_exception(e)
+            finally:
+                service = time.monotonic() - started
+                with self._lock:
+                    self._in_flight -= 1
+                    self._service_avg = service if not self._completed else (
+                        0.9 * self._service_avg + 0.1 * service
+                    )
+                    self._completed += 1
+                self._queue.task_done()
+
+    # ===============================
+    # Stats
+    # ===============================
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "depth": self._queue.qsize(),
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "rejected": dict(self._rejected),
+                "wait_seconds": {
+                    "last": round(self._wait_last, 4),
+                    "avg": round(self._wait_avg, 4),
+                    "max": round(self._wait_max, 4),
+                },
+                "service_seconds_avg": round(self._service_avg, 4),
+            }
+
+
+inference_pool = InferencePool(
+    workers=int(os.getenv("QC_INFERENCE_WORKERS", 1)),
+    max_queue=int(os.getenv("QC_QUEUE_MAX", 8)),
+)
@@ -1,23 +1,88 @@
-from fastapi import FastAPI, UploadFile, File, Query
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Query, Request
+from fastapi.responses import (
+    StreamingResponse, JSONResponse, Response, PlainTextResponse, RedirectResponse
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.staticfiles import StaticFiles
 
+import base64
 import cv2
-import io
+import json
+import os
+import numpy as np
 import threading
 import time
 from datetime import datetime, timedelta
-from PIL import Image, ImageOps
 
-from database.supabase import supabase
-from storage.storage import upload_image, get_public_url
-from qc_service import run_qc, save_qc_result
+from database.async_client import async_db
+from storage.storage import (
+    make_object_path, get_image_url, get_image_urls, thumb_path, THUMB_SIZE,
+    local_storage_root, start_storage, storage_stats,
+)
+from qc_service import (
+    run_qc, run_qc_batch, image_executor, get_qc_overlay, get_qc_stats, qc_cache_key,
+    configure_cpu_threads,
+)
+from persistence import persistence_queue
+from imaging import decode_image_reduced, encode_jpeg, oriented_size
+from inference_pool import (
+    inference_pool, QueueFull, PRIORITY_MANUAL, PRIORITY_CAMERA
+)
+from camera import camera_grabber
+from broadcast import Broadcaster
+from stream_qc import stream_qc
+from model_registry import registry, ModelsNotReady, ModelsLoadFailed
+from result_cache import result_cache
+from metrics import timed, record, server_timing_header, render_metrics
 
 
 app = FastAPI()
 
-camera = None
-camera_lock = threading.Lock()
+
+# ===============================
+# Models: โหลด + warmup ขนานกันเบื้องหลัง (ดูสถานะที่ /health/ready)
+# ===============================
+@app.on_event("startup")
+def load_models():
+    configure_cpu_threads()
+    registry.load_in_background()
+
+
+@app.get("/health/ready")
+def health_ready():
+    # 503 ทั้งตอนกำลังโหลดและตอน failed → ดู "state" / "error" ว่าเป็นแบบไหน
+    status = registry.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@app.post("/models/reload")
+def reload_models():
+    """โหลดโมเดลใหม่หลัง failed (กำลังโหลด / พร้อมแล้ว → ไม่ทำอะไร)"""
+    registry.load_in_background()
+    return JSONResponse(status_code=202, content=registry.status())
+
+
+# ===============================
+# Write-behind persistence (โหลดงานค้างใน spool ด้วย)
+# ===============================
+@app.on_event("startup")
+def start_persistence():
+    start_storage()
+    persistence_queue.start()
+
+
+# ===============================
+# Storage แบบ local / tiered: เสิร์ฟไฟล์จากเครื่องนี้ที่ /files
+# ===============================
+if local_storage_root():
+    app.mount("/files", StaticFiles(directory=local_storage_root()), name="files")
+
+
+@app.on_event("shutdown")
+def stop_camera():
+    stream_qc.stop()
+    camera_grabber.stop()
 
 
 # ===============================
@@ -28,69 +93,96 @@ app.add_middleware(
     allow_origins=["http://localhost:5173"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 # ===============================
 # Camera
 # ===============================
+# frame เก่ากว่านี้ถือว่ากล้องค้าง
+CAMERA_STALE_SECONDS = float(os.getenv("CAMERA_STALE_SECONDS", 2))
+
+
 @app.post("/camera/open")
 def open_camera():
-    global camera
-    with camera_lock:
-        if camera is None:
-            camera = cv2.VideoCapture(0)
-            if not camera.isOpened():
-                camera = None
-                return {"error": "Cannot open camera"}
+    # เริ่ม thread อ่านกล้องเบื้องหลัง (เก็บ frame ล่าสุดไว้ตลอด)
+    if not camera_grabber.start():
+        return {"error": "Cannot open camera"}
     return {"status": "opened"}
 
 @app.post("/camera/close")
 def close_camera():
-    global camera
-    with camera_lock:
-        if camera:
-            camera.release()
-            camera = None
+    camera_grabber.stop()
     return {"status": "closed"}
 
 @app.post("/qc/camera")
-def qc_from_usb_camera():
-    global camera
-    with camera_lock:
-        if camera is None:
-            return JSONResponse(status_code=400, content={"error": "Camera not opened"})
-
-        ret, frame = camera.read()
-        if not ret:
-            return JSONResponse(status_code=500, content={"error": "Capture failed"})
+async def qc_from_usb_camera(request: Request):
+    # snapshot frame ล่าสุดจาก capture thread (ไม่ต้องรอ camera.read())
+    if not camera_grabber.is_running:
+        return JSONResponse(status_code=400, content={"error": "Camera not opened"})
 
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    # img = Image.fromarray(frame).resize((640, 640))
-    img = Image.fromarray(frame) 
-    pil_img = pil_img.convert("RGB")
+    latest = camera_grabber.latest()
+    if latest is None or time.monotonic() - latest[1] > CAMERA_STALE_SECONDS:
+        return JSONResponse(status_code=503, content={"error": "Camera not ready"})
 
+    _, _, frame = latest
 
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG")
-    image_bytes = buf.getvalue()
+    # trigger ซ้ำบน frame เดิม → ผลเดิมจาก cache
+    cache_key, cached = await run_in_threadpool(cache_lookup, request, frame)
+    if cached is not None:
+        return JSONResponse(content=cached)
 
-    result = run_qc(image_bytes)
-    result["status"] = "PASS" if result["status"] in ["Approved", "PASS"] else "FAIL"
+    # frame จาก cv2 เป็น BGR อยู่แล้ว → ส่งเข้า run_qc ตรง ๆ ไม่ต้องผ่าน JPEG
+    try:
+        result = await inference_pool.run(run_qc, frame, priority=PRIORITY_CAMERA)
+    except QueueFull as e:
+        return queue_full_response(e)
+    except ModelsNotReady as e:
+        return models_not_ready_response(e)
 
     filename = f"usb_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-    raw_path = upload_image(image_bytes, filename, "raw")
+    await run_in_threadpool(persist_qc_result, request, result, frame, filename, cache_key)
 
-    overlay_path = upload_image(
-        result["overlay_image"], "overlay.png", "overlay", "image/png"
-    )
+    return JSONResponse(content=ensure_json_safe(result))
 
-    result["image_url"] = get_public_url(raw_path)
-    result["overlay_url"] = get_public_url(overlay_path)
-    result["created_at"] = save_qc_result(raw_path, result)
 
-    return JSONResponse(content=ensure_json_safe(result))
+
+# ===============================
+# Streaming QC (ตรวจต่อเนื่องจากกล้อง + push ผลผ่าน SSE)
+# ===============================
+@app.post("/qc/stream/start")
+def start_stream_qc(
+    fps: float | None = Query(None, gt=0, le=30),
+    persist_every: int | None = Query(None, ge=1),
+):
+    if not stream_qc.start(fps, persist_every):
+        return JSONResponse(status_code=503, content={"error": "Cannot open camera"})
+    return stream_qc.status()
 
 
+@app.post("/qc/stream/stop")
+def stop_stream_qc():
+    stream_qc.stop()
+    return stream_qc.status()
+
+
+@app.get("/qc/stream")
+def stream_qc_status():
+    return stream_qc.status()
+
+
+@app.get("/qc/stream/events")
+def stream_qc_events():
+    async def gen():
+        async for event in stream_qc.events.subscribe():
+            yield f"data: {json.dumps(ensure_json_safe(event))}\n\n"
+
+    return StreamingResponse(
+        gen(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store"},
+    )
+
 
 # ===============================
 # CCTV
@@ -141,16 +233,92 @@ def qc_from_usb_camera():
 # ===============================
 # Utils
 # ===============================
-def preprocess_image(image_bytes: bytes) -> bytes:
-    img = Image.open(io.BytesIO(image_bytes))
-    img = ImageOps.exif_transpose(img)
-    img = img.convert("RGB")
-    # img = img.resize((640, 640))
-    img = img.convert("RGB")
+def preprocess_image(image_bytes: bytes, timings: dict | None = None) -> tuple[np.ndarray, bytes | None]:
+    """
+    decode ไฟล์ที่ upload มาครั้งเดียว (EXIF แล้ว) → numpy BGR สำหรับ inference
+    JPEG: decode แบบย่อ (DCT scaling) ใกล้ขนาด input ของโมเดล ไม่ decode 12 MP เต็ม
+          + คืนไฟล์เดิมไว้เก็บเป็น raw ความละเอียดเต็ม (ไม่ต้อง encode ใหม่)
+    อื่น ๆ: decode เต็ม, raw = None (encode JPEG ตอน upload เหมือนเดิม)
+    """
+    with timed("decode", timings):
+        image, is_jpeg = decode_image_reduced(image_bytes)
+    return image, (image_bytes if is_jpeg else None)
+
+
+def absolute_url(request: Request, url: str | None) -> str | None:
+    """URL ของ local storage เป็น path (/files/...) → ต่อกับ host ที่ client ใช้เรียก request นี้"""
+    if url and url.startswith("/"):
+        return f"{str(request.base_url).rstrip('/')}{url}"
+    return url
+
+
+def cache_lookup(
+    request: Request, image: np.ndarray, timings: dict | None = None
+) -> tuple[str | None, dict | None]:
+    """
+    hash pixel ของภาพ → (cache key, ผลเดิมถ้าเคยตรวจภาพนี้แล้ว)
+    hit = ไม่ต้องรัน inference / upload ซ้ำ
+    key = None → โมเดลยังโหลดไม่เสร็จ ไม่ใช้ cache
+    """
+    with timed("cache_lookup", timings):
+        key = qc_cache_key(image)
+        cached = result_cache.get(key) if key else None
+    if cached is not None:
+        cached["cached"] = True
+        raw_path = cached.pop("_raw_path", None)
+        # ยังอยู่ใน spool → ใช้ URL ของ /qc/{id}/image ที่เก็บไว้ (ไฟล์ยังไม่ขึ้น bucket)
+        # upload แล้ว → signed URL มีอายุ ขอใหม่ (ผ่าน cache ของ storage)
+        if raw_path and not persistence_queue.is_pending(str(cached.get("id_qc"))):
+            cached["image_url"] = absolute_url(request, get_image_url(raw_path))
+            cached["image_pending"] = False
+    return key, cached
+
+
+async def run_in_pool(fn, *args, priority: int, timings: dict | None = None):
+    """
+    inference_pool.run + เวลารอคิว (เวลาทั้งหมด − เวลาที่ fn ใช้จริง)
+    fn ต้องรับ timings เป็น argument สุดท้าย (run_qc / run_qc_batch)
+    """
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+
+    result = await inference_pool.run(fn, *args, timings, priority=priority)
+
+    waited = time.perf_counter() - started - timings.get("run_qc", 0) / 1000
+    record("queue", max(0.0, waited), timings)
+    return result
+
+
+def timed_json_response(content, timings: dict, started: float) -> JSONResponse:
+    """JSONResponse + Server-Timing (แต่ละขั้น + total)"""
+    timings["total"] = (time.perf_counter() - started) * 1000
+    return JSONResponse(
+        content=content,
+        headers={"Server-Timing": server_timing_header(timings)},
+    )
 
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG")
-    return buf.getvalue()
+
+def queue_full_response(e: QueueFull) -> JSONResponse:
+    """คิว inference เต็ม → ตอบกลับทันทีแทนการรอ"""
+    return JSONResponse(
+        status_code=503,
+        content={"error": "QC queue is full, please retry", "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def models_not_ready_response(e: ModelsNotReady) -> JSONResponse:
+    """โมเดลยังโหลด / warmup ไม่เสร็จ (Retry-After) หรือโหลดไม่สำเร็จ (รอไปก็ไม่พร้อม)"""
+    if isinstance(e, ModelsLoadFailed):
+        return JSONResponse(
+            status_code=503,
+            content={"error": "QC models failed to load", "detail": registry.error},
+        )
+    return JSONResponse(
+        status_code=503,
+        content={"error": "QC models are still loading"},
+        headers={"Retry-After": "5"},
+    )
 
 
 def ensure_json_safe(obj):
@@ -166,37 +334,148 @@ def ensure_json_safe(obj):
 # ===============================
 # CCTV Stream (LIVE) ✏️ แก้
 # ===============================
-# def gen_frames():
-#     global latest_frame
+# encode JPEG ครั้งเดียวต่อ frame แล้วส่ง buffer เดียวกันให้ทุก client
+# - ไม่มีคนดู → encoder หยุดเอง (หลัง CCTV_IDLE_SECONDS)
+# - client ช้า → ได้ frame ล่าสุดเสมอ (ข้าม frame ที่พลาด ไม่มีคิวค้าง)
+# ===============================
+CCTV_FPS = float(os.getenv("CCTV_FPS", 10))
+CCTV_JPEG_QUALITY = int(os.getenv("CCTV_JPEG_QUALITY", 70))
+CCTV_MAX_WIDTH = int(os.getenv("CCTV_MAX_WIDTH", 960))
+CCTV_IDLE_SECONDS = 5
 
-#     while True:
-#         with lock:
-#             if latest_frame is None:
-#                 continue
-#             frame = latest_frame.copy()
+cctv_broadcaster = Broadcaster()
+_cctv_encoder = None
+_cctv_encoder_lock = threading.Lock()
 
-#         _, buffer = cv2.imencode(".jpg", frame)
-#         yield (
-#             b"--frame\r\n"
-#             b"Content-Type: image/jpeg\r\n\r\n"
-#             + buffer.tobytes()
-#             + b"\r\n"
-#         )
+
+def cctv_encode_loop():
+    interval = 1 / CCTV_FPS
+    last_seq = None
+    idle_since = None
+
+    while True:
+        started = time.monotonic()
+
+        if cctv_broadcaster.subscriber_count == 0:
+            idle_since = idle_since or started
+            if started - idle_since > CCTV_IDLE_SECONDS:
+                return
+        else:
+            idle_since = None
+
+        latest = camera_grabber.latest()
+
+        # encode เฉพาะ frame ใหม่ ครั้งเดียว ไม่ว่าจะมีกี่ client
+        if latest is not None and latest[0] != last_seq:
+            last_seq, _, frame = latest
+
+            if CCTV_MAX_WIDTH and frame.shape[1] > CCTV_MAX_WIDTH:
+                height = round(frame.shape[0] * CCTV_MAX_WIDTH / frame.shape[1])
+                frame = cv2.resize(frame, (CCTV_MAX_WIDTH, height), interpolation=cv2.INTER_AREA)
+
+            cctv_broadcaster.publish(
+                b"--frame\r\n"
+                b"Content-Type: image/jpeg\r\n\r\n"
+                + encode_jpeg(frame, CCTV_JPEG_QUALITY)
+                + b"\r\n"
+            )
+
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+def ensure_cctv_encoder():
+    global _cctv_encoder
+    with _cctv_encoder_lock:
+        if _cctv_encoder is None or not _cctv_encoder.is_alive():
+            _cctv_encoder = threading.Thread(
+                target=cctv_encode_loop, name="cctv-encoder", daemon=True
+            )
+            _cctv_encoder.start()
 
 
-# @app.get("/cctv")
-# def cctv_stream():
-#     return StreamingResponse(
-#         gen_frames(),
-#         media_type="multipart/x-mixed-replace; boundary=frame",
-#     )
+@app.get("/cctv")
+def cctv_stream():
+    if not camera_grabber.start():
+        return JSONResponse(status_code=503, content={"error": "Cannot open camera"})
+
+    ensure_cctv_encoder()
+
+    return StreamingResponse(
+        cctv_broadcaster.subscribe(),
+        media_type="multipart/x-mixed-replace; boundary=frame",
+        headers={"Cache-Control": "no-store"},
+    )
 
 
 # ===============================
 # QC Upload
 # ===============================
+def persist_qc_result(
+    request: Request, result: dict, image: np.ndarray, filename: str,
+    cache_key: str | None = None, raw_bytes: bytes | None = None,
+    timings: dict | None = None,
+) -> dict:
+    """
+    normalize status แล้วส่งเข้า write-behind queue (upload + insert เบื้องหลัง)
+    image: numpy BGR ที่ใช้รัน QC (encode JPEG ตรงนี้ที่เดียว)
+    raw_bytes: ไฟล์ JPEG ต้นฉบับ → เก็บเป็น raw แทนการ encode image
+               (detections ยังเป็นพิกัดของ image, เก็บ original_size ไว้ map กลับ)
+    แก้ไข result ในที่ (id_qc / image_url / overlay_url / created_at)
+    id_qc ที่ได้เป็น job_id (provisional) จนกว่าจะบันทึกลง DB
+    cache_key: ถ้ามี → เก็บผลลง result cache (เฉพาะที่ enqueue สำเร็จ)
+    """
+
+    # ===============================
+    # 4. Normalize status
+    # ===============================
+    result["status"] = "PASS" if result.get("status") in ["Approved", "PASS"] else "FAIL"
+
+    # ===============================
+    # 5. Spool RAW image + result (ไม่มี network I/O ตรงนี้)
+    #    ไฟล์ยังไม่ขึ้น bucket → image_url ชี้ /qc/{id}/image (เสิร์ฟจาก spool
+    #    จนกว่า upload เสร็จ แล้ว redirect ไป storage)
+    # ===============================
+    try:
+        if raw_bytes is not None and result.get("detections"):
+            result["detections"]["original_size"] = list(oriented_size(raw_bytes))
+
+        if raw_bytes is None:
+            with timed("encode", timings):
+                raw_bytes = encode_jpeg(image)
+
+        # local / tiered storage: ชื่อไฟล์ = hash ของเนื้อไฟล์ (ภาพซ้ำเก็บครั้งเดียว)
+        raw_name = f"{os.path.splitext(filename or 'image')[0]}.jpg"
+        raw_path = make_object_path(raw_name, "raw", raw_bytes)
+
+        with timed("enqueue", timings):
+            job = persistence_queue.enqueue(raw_path, raw_bytes, result)
+
+        result["id_qc"] = job["job_id"]
+        result["created_at"] = job["created_at"]
+        result["image_url"] = str(request.url_for("qc_image", qc_id=job["job_id"]))
+        result["image_pending"] = True
+        result["overlay_url"] = str(
+            request.url_for("qc_overlay", qc_id=job["job_id"])
+        )
+    except Exception as e:
+        print("❌ Persist enqueue error:", e)
+        result["image_url"] = None
+        result["image_pending"] = False
+        result["overlay_url"] = None
+        result["created_at"] = None
+
+    # detections ถูกเก็บไปกับ record แล้ว ไม่ต้องส่งกลับ
+    result.pop("detections", None)
+    result["cached"] = False
+
+    if cache_key and result.get("image_url"):
+        result_cache.put(cache_key, {**result, "_raw_path": raw_path})
+
+    return result
+
+
 @app.post("/qc")
-async def qc_api(file: UploadFile = File(...)):
+async def qc_api(request: Request, file: UploadFile = File(...)):
     try:
         print("📥 File received:", file.filename)
 
@@ -207,20 +486,36 @@ async def qc_api(file: UploadFile = File(...)):
         if not raw_bytes:
             return JSONResponse(status_code=400, content={"error": "Empty file"})
 
+        started = time.perf_counter()
+        timings = {}
+
         # ===============================
         # 2. Preprocess
         # ===============================
         try:
-            image_bytes = preprocess_image(raw_bytes)
+            image, raw_jpeg = await run_in_threadpool(preprocess_image, raw_bytes, timings)
         except Exception as e:
             print("❌ Preprocess error:", e)
             return JSONResponse(status_code=400, content={"error": "Invalid image file"})
 
+        # ===============================
+        # 2.5 Result cache (ภาพเดิม → ผล + URL เดิม)
+        # ===============================
+        cache_key, cached = await run_in_threadpool(cache_lookup, request, image, timings)
+        if cached is not None:
+            return timed_json_response(cached, timings, started)
+
         # ===============================
         # 3. Run QC
         # ===============================
         try:
-            result = run_qc(image_bytes)
+            result = await run_in_pool(
+                run_qc, image, False, priority=PRIORITY_MANUAL, timings=timings
+            )
+        except QueueFull as e:
+            return queue_full_response(e)
+        except ModelsNotReady as e:
+            return models_not_ready_response(e)
         except Exception as e:
             print("❌ run_qc error:", e)
             return JSONResponse(status_code=500, content={"error": "QC processing failed"})
@@ -229,66 +524,151 @@ async def qc_api(file: UploadFile = File(...)):
             return JSONResponse(status_code=500, content={"error": "Invalid QC result format"})
 
         # ===============================
-        # 4. Normalize status
+        # 4-6. Normalize + upload + save
         # ===============================
-        result["status"] = "PASS" if result.get("status") in ["Approved", "PASS"] else "FAIL"
+        await run_in_threadpool(
+            persist_qc_result, request, result, image, file.filename, cache_key, raw_jpeg, timings
+        )
 
         # ===============================
-        # 5. Upload RAW image
+        # 8. Return safe JSON (+ Server-Timing)
         # ===============================
-        try:
-            raw_path = upload_image(image_bytes, file.filename, "raw")
-            result["image_url"] = get_public_url(raw_path)
-        except Exception as e:
-            print("❌ RAW upload error:", e)
-            result["image_url"] = None
-            raw_path = None
+        return timed_json_response(ensure_json_safe(result), timings, started)
+
+    except Exception as e:
+        print("🔥 FATAL ERROR:", e)
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+
+# ===============================
+# QC Batch Upload (ทั้ง rack ในครั้งเดียว)
+# ===============================
+QC_BATCH_MAX = int(os.getenv("QC_BATCH_MAX", 16))
+
+
+def _preprocess_or_none(raw_bytes: bytes):
+    """(ภาพ, raw JPEG หรือ None) หรือ None ถ้าไฟล์เสีย"""
+    if not raw_bytes:
+        return None
+    try:
+        return preprocess_image(raw_bytes)
+    except Exception as e:
+        print("❌ Preprocess error:", e)
+        return None
+
+
+@app.post("/qc/batch")
+async def qc_batch_api(request: Request, files: list[UploadFile] = File(...)):
+    try:
+        print("📥 Batch received:", len(files), "files")
+
+        if len(files) > QC_BATCH_MAX:
+            return JSONResponse(
+                status_code=400,
+                content={"error": f"Too many files (max {QC_BATCH_MAX})"},
+            )
 
         # ===============================
-        # 6. Upload overlay image (ถ้ามี)
+        # 1. อ่านไฟล์ + preprocess ขนานกัน
         # ===============================
-        overlay_image = result.get("overlay_image")
-
-        if overlay_image:
-            try:
-                overlay_path = upload_image(
-                    overlay_image,
-                    f"overlay_{file.filename}",
-                    "overlay",
-                    "image/png"
-                )
-                result["overlay_url"] = get_public_url(overlay_path)
-            except Exception as e:
-                print("❌ Overlay upload error:", e)
-                result["overlay_url"] = None
-        else:
-            result["overlay_url"] = None
+        raw_list = [await f.read() for f in files]
+
+        started = time.perf_counter()
+        timings = {}
+
+        decoded = await run_in_threadpool(
+            lambda: list(image_executor.map(_preprocess_or_none, raw_list))
+        )
+        # decode ขนานกัน → เวลาของ request = wall time (histogram เก็บรายภาพแล้ว)
+        timings["decode"] = (time.perf_counter() - started) * 1000
 
-        # ลบ overlay_image ออกจาก response (เพราะเป็น bytes)
-        result.pop("overlay_image", None)
+        valid_idx = [i for i, d in enumerate(decoded) if d is not None]
 
         # ===============================
-        # 7. Save to database (ถ้า raw_path มีค่า)
+        # 1.5 Result cache (ภาพที่เคยตรวจแล้วไม่ต้องเข้าโมเดล)
         # ===============================
-        if raw_path:
-            try:
-                result["created_at"] = save_qc_result(raw_path, result)
-            except Exception as e:
-                print("❌ Database save error:", e)
-                result["created_at"] = None
-        else:
-            result["created_at"] = None
+        lookups = dict(zip(valid_idx, await run_in_threadpool(
+            lambda: list(image_executor.map(
+                lambda img: cache_lookup(request, img), [decoded[i][0] for i in valid_idx]
+            ))
+        )))
+
+        responses = [
+            {"filename": f.filename, "error": "Invalid image file"} for f in files
+        ]
+
+        for i, (_, cached) in lookups.items():
+            if cached is not None:
+                responses[i] = {"filename": files[i].filename, **cached}
+
+        valid_idx = [i for i in valid_idx if lookups[i][1] is None]
 
         # ===============================
-        # 8. Return safe JSON
+        # 2. Run QC (1 batched predict ต่อโมเดล)
         # ===============================
-        return JSONResponse(content=ensure_json_safe(result))
+        try:
+            batch_results = await run_in_pool(
+                run_qc_batch,
+                [decoded[i][0] for i in valid_idx],
+                False,
+                priority=PRIORITY_MANUAL,
+                timings=timings,
+            ) if valid_idx else []
+        except QueueFull as e:
+            return queue_full_response(e)
+        except ModelsNotReady as e:
+            return models_not_ready_response(e)
+        except Exception as e:
+            print("❌ run_qc_batch error:", e)
+            return JSONResponse(status_code=500, content={"error": "QC processing failed"})
+
+        # ===============================
+        # 3. Upload + save ทีละภาพ (ผลรูปแบบเดียวกับ /qc)
+        # ===============================
+        def persist_all():
+            for i, result in zip(valid_idx, batch_results):
+                image, raw_jpeg = decoded[i]
+                persist_qc_result(
+                    request, result, image, files[i].filename, lookups[i][0], raw_jpeg, timings
+                )
+                responses[i] = {"filename": files[i].filename, **result}
+
+        await run_in_threadpool(persist_all)
+
+        return timed_json_response(ensure_json_safe(responses), timings, started)
 
     except Exception as e:
         print("🔥 FATAL ERROR:", e)
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
+# ===============================
+# Metrics (Prometheus text format)
+# ===============================
+@app.get("/metrics")
+def metrics():
+    body = render_metrics({
+        "qc_queue": inference_pool.stats(),
+        "qc_persistence": persistence_queue.stats(),
+        "qc_result_cache": result_cache.stats(),
+        "qc_storage": storage_stats(),
+    })
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+# ===============================
+# QC Queue stats (depth / wait time)
+# ===============================
+@app.get("/qc/queue")
+def qc_queue():
+    return {
+        **inference_pool.stats(),
+        "persistence": persistence_queue.stats(),
+        "result_cache": result_cache.stats(),
+        "storage": storage_stats(),
+    }
+
 
 # ===============================
 # QC from CCTV ✅ ใช้ได้ทันที
@@ -330,6 +710,65 @@ async def qc_api(file: UploadFile = File(...)):
 #         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
+# ===============================
+# QC Raw image (spool ระหว่างรอ upload → storage เมื่อบันทึกแล้ว)
+# ===============================
+@app.get("/qc/{qc_id}/image", name="qc_image")
+def qc_image(request: Request, qc_id: str):
+    pending = persistence_queue.pending_job(qc_id)
+    if pending is not None:
+        return Response(
+            content=pending[0],
+            media_type="image/jpeg",
+            headers={"Cache-Control": "no-store"},
+        )
+
+    id_column = "id_qc" if qc_id.isdigit() else "job_id"
+    try:
+        res = async_db.call(async_db.select("qc_result", [
+            ("select", "image_name"),
+            (id_column, f"eq.{qc_id}"),
+            ("limit", "1"),
+        ]))
+        image_url = absolute_url(request, get_image_url(res[0]["image_name"])) if res else None
+    except Exception as e:
+        print("❌ Image lookup error:", e)
+        return JSONResponse(status_code=500, content={"error": "Image lookup failed"})
+
+    if image_url is None:
+        return JSONResponse(status_code=404, content={"error": "QC record not found"})
+
+    return RedirectResponse(image_url, status_code=302)
+
+
+# ===============================
+# QC Overlay (render ตอนเปิดดูครั้งแรก แล้ว cache)
+# ===============================
+@app.get("/qc/{qc_id}/overlay", name="qc_overlay")
+def qc_overlay(
+    qc_id: str,
+    format: str = Query("png", enum=["png", "jpeg", "webp"]),
+    width: int | None = Query(None, gt=0, le=8192),
+):
+    try:
+        overlay = get_qc_overlay(
+            qc_id, format, width, pending=persistence_queue.pending_job(qc_id)
+        )
+    except Exception as e:
+        print("❌ Overlay render error:", e)
+        return JSONResponse(status_code=500, content={"error": "Overlay render failed"})
+
+    if overlay is None:
+        return JSONResponse(status_code=404, content={"error": "QC record not found"})
+
+    data, content_type = overlay
+    return Response(
+        content=data,
+        media_type=content_type,
+        headers={"Cache-Control": "public, max-age=86400, immutable"},
+    )
+
+
 # ===============================
 # QC History (เหมือนเดิม)
 # ===============================
@@ -355,41 +794,120 @@ def calc_date_range(range_type: str, date_str: str):
     return start.isoformat(), end.isoformat()
 
 
+QC_HISTORY_PAGE_MAX = 200
+
+
+def encode_history_cursor(row: dict) -> str:
+    raw = json.dumps([row["created_at"], row["id_qc"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str):
+    """
+    cursor มาจาก client → ตรวจรูปแบบก่อนใส่ลง filter ของ PostgREST
+    (created_at ต้องเป็นเวลา ISO, id_qc ต้องเป็นตัวเลข ไม่งั้น raise → 400)
+    """
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    created_at, id_qc = json.loads(raw)
+
+    if not isinstance(created_at, str) or isinstance(id_qc, bool):
+        raise ValueError("invalid cursor")
+
+    # isoformat() ใหม่จากค่าที่ parse แล้ว → ไม่มีอักขระอื่นหลุดเข้า filter
+    return datetime.fromisoformat(created_at).isoformat(), int(id_qc)
+
+
 @app.get("/qc/history")
 def qc_history(
+    request: Request,
     range: str | None = Query(None, enum=["day", "week", "month", "year"]),
     date: str | None = Query(None),
+    limit: int = Query(50, ge=1, le=QC_HISTORY_PAGE_MAX),
+    cursor: str | None = Query(None),
 ):
-    query = (
-        supabase
-        .table("qc_result")
-        .select("id_qc, image_name, total_count, status, created_at")
-        .order("created_at", desc=True)
-    )
+    """
+    keyset pagination เรียง (created_at, id_qc) ใหม่ → เก่า
+    1 query ต่อหน้า (embed qc_item มาด้วย)
+    image_url: bucket private → signed URL ทั้งหน้าในการเซ็นครั้งเดียว (มี cache)
+    thumb_url / overlay_thumb_url: ภาพย่อสำหรับตาราง (ภาพเต็มโหลดตอนกดดูแถว)
+    return: {"data": [...], "next_cursor": str | None}
+    """
+    params = [
+        ("select", "id_qc,image_name,total_count,status,created_at,qc_item(class,count,ratio)"),
+        ("order", "created_at.desc,id_qc.desc"),
+        ("limit", str(limit + 1)),
+    ]
 
     if range and date:
         start, end = calc_date_range(range, date)
-        query = query.gte("created_at", start).lt("created_at", end)
+        params += [("created_at", f"gte.{start}"), ("created_at", f"lt.{end}")]
+
+    if cursor:
+        try:
+            last_created_at, last_id = decode_history_cursor(cursor)
+        except Exception:
+            return JSONResponse(status_code=400, content={"error": "Invalid cursor"})
 
-    qc_res = query.execute()
-    qc_ids = [r["id_qc"] for r in qc_res.data]
+        params.append((
+            "or",
+            f'(created_at.lt."{last_created_at}",'
+            f'and(created_at.eq."{last_created_at}",id_qc.lt.{last_id}))',
+        ))
 
-    items_res = (
-        supabase
-        .table("qc_item")
-        .select("qc_id, class, count, ratio")
-        .in_("qc_id", qc_ids)
-        .execute()
-    )
+    rows = async_db.call(async_db.select("qc_result", params))
+
+    # ดึงเกินมา 1 แถว → รู้ว่ามีหน้าถัดไปหรือไม่
+    next_cursor = encode_history_cursor(rows[limit - 1]) if len(rows) > limit else None
 
-    item_map = {}
-    for i in items_res.data:
-        item_map.setdefault(i["qc_id"], []).append(i)
+    rows = rows[:limit]
 
-    return [
-        {
-            **r,
-            "items": item_map.get(r["id_qc"], []),
+    # ภาพเต็ม + ภาพย่อ เซ็นรวมใน batch เดียว
+    paths = [r["image_name"] for r in rows]
+    thumbs = {p: thumb_path(p) for p in paths if p}
+
+    try:
+        image_urls = {
+            path: absolute_url(request, url)
+            for path, url in get_image_urls(paths + list(thumbs.values())).items()
         }
-        for r in qc_res.data
-    ]
+    except Exception as e:
+        print("❌ Image URL error:", e)
+        image_urls = {}
+
+    def overlay_url(id_qc):
+        return str(request.url_for("qc_overlay", qc_id=str(id_qc)))
+
+    return {
+        "data": [
+            {
+                "id_qc": r["id_qc"],
+                "image_name": r["image_name"],
+                "image_url": image_urls.get(r["image_name"]),
+                "thumb_url": image_urls.get(thumbs.get(r["image_name"])),
+                "overlay_url": overlay_url(r["id_qc"]),
+                "overlay_thumb_url": f"{overlay_url(r['id_qc'])}?width={THUMB_SIZE}&format=webp",
+                "total_count": r["total_count"],
+                "status": r["status"],
+                "created_at": r["created_at"],
+                "items": r.get("qc_item", []),
+            }
+            for r in rows
+        ],
+        "next_cursor": next_cursor,
+    }
+
+
+# ===============================
+# QC Stats (dashboard วัน / สัปดาห์ / เดือน / ปี)
+# ===============================
+@app.get("/qc/stats")
+def qc_stats(
+    range: str = Query("day", enum=["day", "week", "month", "year"]),
+    date: str | None = Query(None),
+):
+    try:
+        start, end = calc_date_range(range, date or datetime.utcnow().date().isoformat())
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Invalid date"})
+
+    return get_qc_stats(range, start, end)
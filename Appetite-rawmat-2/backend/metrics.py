@@ -0,0 +1,127 @@
+# ===============================
+# metrics.py
+# ===============================
+# จับเวลาแต่ละขั้นของงาน QC
+# - histogram สะสม → /metrics (Prometheus text format)
+# - timings ต่อ request (dict ชื่อขั้น → ms) → header Server-Timing ของ /qc
+#
+# ใช้งาน:
+#   with timed("decode", timings):
+#       ...
+# ===============================
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# วินาที (decode ไม่กี่ ms ถึง upload / insert หลายวินาที)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+
+    def __init__(self, name: str, help_text: str, label: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+
+        # label value → [bucket counts..., +Inf], sum
+        self._counts = {}
+        self._sums = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float):
+        with self._lock:
+            counts = self._counts.get(label_value)
+            if counts is None:
+                counts = self._counts[label_value] = [0] * (len(self.buckets) + 1)
+                self._sums[label_value] = 0.0
+
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[label_value] += seconds
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+
+        with self._lock:
+            for value, counts in sorted(self._counts.items()):
+                lbl = f'{self.label}="{value}"'
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{lbl},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{lbl},le="+Inf"}} {counts[-1]}')
+                lines.append(f"{self.name}_sum{{{lbl}}} {self._sums[value]:.6f}")
+                lines.append(f"{self.name}_count{{{lbl}}} {counts[-1]}")
+
+        return lines
+
+
+stage_seconds = Histogram("qc_stage_seconds", "Time spent per QC pipeline stage", "stage")
+model_seconds = Histogram("qc_model_seconds", "Forward pass time per model", "model")
+
+
+# ===============================
+# Timers
+# ===============================
+
+def record(stage: str, seconds: float, timings: dict | None = None):
+    """บันทึกเวลาลง histogram (+ timings ของ request ถ้ามี, หน่วย ms สะสม)"""
+    if stage.startswith("model."):
+        model_seconds.observe(stage[len("model."):], seconds)
+    else:
+        stage_seconds.observe(stage, seconds)
+
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds * 1000
+
+
+@contextmanager
+def timed(stage: str, timings: dict | None = None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started, timings)
+
+
+# ===============================
+# Export
+# ===============================
+
+def server_timing_header(timings: dict) -> str:
+    """{"decode": 12.3} → 'decode;dur=12.3' (ชื่อ metric ใช้ได้เฉพาะ token chars)"""
+    return ", ".join(
+        f"{re.sub(r'[^A-Za-z0-9_.-]', '_', stage)};dur={ms:.1f}"
+        for stage, ms in timings.items()
+    )
+
+
+def _flatten(prefix: str, values: dict, lines: list[str]):
+    for key, value in values.items():
+        name = f"{prefix}_{re.sub(r'[^A-Za-z0-9_]', '_', key)}"
+        if isinstance(value, dict):
+            _flatten(name, value, lines)
+        elif isinstance(value, bool):
+            lines.append(f"{name} {int(value)}")
+        elif isinstance(value, (int, float)):
+            lines.append(f"{name} {value}")
+
+
+def render_metrics(gauges: dict | None = None) -> str:
+    """
+    histogram ทั้งหมด + ค่าตัวเลขจาก stats ต่าง ๆ (เป็น gauge)
+    gauges: {"qc_queue": inference_pool.stats(), ...}
+    """
+    lines = stage_seconds.render() + model_seconds.render()
+
+    for prefix, values in (gauges or {}).items():
+        _flatten(prefix, values, lines)
+
+    return "\n".join(lines) + "\n"
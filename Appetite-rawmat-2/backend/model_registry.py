@@ -0,0 +1,294 @@
+# ===============================
+# model_registry.py
+# ===============================
+# ทะเบียนโมเดล QC
+# - อ่าน config จาก models.yaml (หรือ QC_MODEL_CONFIG) แทน path ที่ hard-code
+# - โหลดทุกโมเดลขนานกัน + warmup ด้วยภาพ dummy
+#   → request จริงครั้งแรกเร็วเท่าครั้งที่ร้อย
+# - เก็บเวลาโหลด / warmup ต่อโมเดลไว้ให้ /health/ready
+# ===============================
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import yaml
+from ultralytics import YOLO
+
+MODEL_CONFIG_PATH = os.getenv(
+    "QC_MODEL_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.yaml"),
+)
+
+
+# ===============================
+# Inference backend
+# ===============================
+# torch    : .pt ตามเดิม
+# onnx     : <name>.onnx           (ONNX Runtime CPU)
+# openvino : <name>_openvino_model (OpenVINO IR)
+# export ด้วย: python export_models.py --format onnx|openvino
+# เลือกด้วย QC_BACKEND หรือ backend: ใน models.yaml (ต่อโมเดลได้)
+#
+# precision: int8 → <name>_int8_openvino_model (quantize_models.py)
+# INT8 มีเฉพาะ OpenVINO จึงบังคับ backend เป็น openvino
+# เลือกด้วย QC_PRECISION หรือ precision: ใน models.yaml (ต่อโมเดลได้)
+# ===============================
+
+BACKENDS = ("torch", "onnx", "openvino")
+PRECISIONS = ("fp32", "int8")
+
+
+class ModelsNotReady(Exception):
+    pass
+
+
+class ModelsLoadFailed(ModelsNotReady):
+    """โหลดจบแล้วแต่ไม่มีโมเดลใช้ได้ (ไม่ได้กำลังโหลด → รอไปก็ไม่พร้อม)"""
+    pass
+
+
+def exported_path(pt_path: str, backend: str, precision: str = "fp32") -> str:
+    """path ของไฟล์ที่ export จาก .pt (รูปแบบเดียวกับ ultralytics export)"""
+    stem = os.path.splitext(pt_path)[0]
+
+    if precision == "int8":
+        return f"{stem}_int8_openvino_model"
+    if backend == "onnx":
+        return f"{stem}.onnx"
+    if backend == "openvino":
+        return f"{stem}_openvino_model"
+    return pt_path
+
+
+def resolve_weights(cfg: dict, options: dict) -> tuple[str, str, str]:
+    """
+    เลือกไฟล์ weights ตาม backend / precision
+    ยังไม่ได้ quantize → fp32 ของ backend เดิม, ยังไม่ได้ export → .pt (แจ้งเตือน)
+    return: (path, backend, precision ที่ใช้จริง)
+    """
+    backend = cfg.get("backend") or options["backend"]
+    precision = cfg.get("precision") or options["precision"]
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {precision}")
+
+    if precision == "int8":
+        path = exported_path(cfg["path"], "openvino", "int8")
+        if os.path.exists(path):
+            return path, "openvino", "int8"
+        print(f"⚠️ {path} not found, falling back to fp32")
+
+    path = exported_path(cfg["path"], backend)
+
+    if backend != "torch" and not os.path.exists(path):
+        print(f"⚠️ {path} not found, falling back to torch weights")
+        return cfg["path"], "torch", "fp32"
+
+    return path, backend, "fp32"
+
+
+def weights_version(path: str) -> str:
+    """version ของไฟล์ weights จากขนาด + เวลาแก้ไข (โฟลเดอร์ OpenVINO = ทุกไฟล์ข้างใน)"""
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(root, f) for root, _, names in os.walk(path) for f in names
+        )
+    else:
+        files = [path]
+
+    h = hashlib.blake2b(digest_size=8)
+    for f in files:
+        st = os.stat(f)
+        h.update(f"{os.path.basename(f)}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return h.hexdigest()
+
+
+def load_model_configs(config_path: str) -> tuple[dict, dict]:
+    """
+    return: (MODEL_CONFIGS รูปแบบเดิม {name: {path, bgr, hex}}, ค่า config อื่น ๆ)
+    """
+    with open(config_path, encoding="utf-8") as f:
+        raw = yaml.safe_load(f)
+
+    model_dir = os.getenv("QC_MODEL_DIR", raw.get("model_dir", ""))
+
+    configs = {}
+    for name, cfg in raw["models"].items():
+        path = cfg["path"]
+        if model_dir and not os.path.isabs(path) and not path.startswith(("\\", "/")):
+            path = os.path.join(model_dir, path)
+
+        configs[name] = {
+            **cfg,
+            "path": path,
+            "bgr": tuple(cfg.get("bgr", (255, 255, 255))),
+            "hex": cfg.get("hex", "#FFFFFF"),
+        }
+
+    options = {k: v for k, v in raw.items() if k != "models"}
+    options["backend"] = os.getenv("QC_BACKEND", options.get("backend", "torch"))
+    options["precision"] = os.getenv("QC_PRECISION", options.get("precision", "fp32"))
+    return configs, options
+
+
+class ModelRegistry:
+
+    def __init__(self, config_path: str):
+        self.config_path = config_path
+        self.configs, self.options = load_model_configs(config_path)
+
+        # dict เดียวกันตลอด (qc_service อ้างถึงตรง ๆ) เติมเมื่อโหลดเสร็จ
+        self.models = {}
+
+        self.info = {
+            name: {
+                "status": "pending",
+                "path": cfg["path"],
+                "backend": None,
+                "precision": None,
+                "version": None,
+                "load_seconds": None,
+                "warmup_seconds": None,
+                "error": None,
+            }
+            for name, cfg in self.configs.items()
+        }
+
+        self.startup_seconds = None
+        self.version = None   # รวม version ของทุกโมเดลที่โหลดได้ (ใช้เป็นส่วนหนึ่งของ cache key)
+        self.state = "pending"   # pending → loading → ready / failed (failed โหลดใหม่ได้)
+        self.error = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._loading = False
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: float | None = None):
+        if not self._ready.wait(timeout):
+            if self.state == "failed":
+                raise ModelsLoadFailed(f"QC models failed to load: {self.error}")
+            raise ModelsNotReady("QC models are not loaded yet")
+
+    # ===============================
+    # Load
+    # ===============================
+
+    def _load_one(self, name: str):
+        cfg = self.configs[name]
+        info = self.info[name]
+        info["status"] = "loading"
+
+        try:
+            weights, backend, precision = resolve_weights(cfg, self.options)
+            info["path"] = weights
+            info["backend"] = backend
+            info["precision"] = precision
+            info["version"] = weights_version(weights)
+
+            started = time.perf_counter()
+            model = YOLO(weights, task=cfg.get("task"))
+            info["load_seconds"] = round(time.perf_counter() - started, 3)
+
+            # warmup: จ่ายค่า lazy init (predictor, fuse, alloc / ORT session) ตอนนี้เลย
+            imgsz = int(cfg.get("imgsz") or self.options.get("warmup_imgsz", 640))
+            dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+
+            started = time.perf_counter()
+            model(dummy, verbose=False)
+            info["warmup_seconds"] = round(time.perf_counter() - started, 3)
+
+            with self._lock:
+                self.models[name] = model
+            info["status"] = "ready"
+            print(f"[OK] Loaded model: {name} ({info['load_seconds']}s + warmup {info['warmup_seconds']}s)")
+        except Exception as e:
+            info["status"] = "failed"
+            info["error"] = str(e)
+            print(f"[FAIL] {name}: {e}")
+
+    def load_all(self):
+        """
+        โหลด + warmup ทุกโมเดลขนานกัน
+        เรียกซ้ำได้: ระหว่างโหลด / พร้อมแล้ว → ไม่ทำอะไร, failed → โหลดใหม่
+        """
+        with self._lock:
+            if self._loading or self.is_ready:
+                return
+            self._loading = True
+            self.state = "loading"
+            self.error = None
+
+        try:
+            self._load_all()
+        except Exception as e:
+            with self._lock:
+                self.state = "failed"
+                self.error = str(e)
+            print(f"[FAIL] Model registry: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._loading = False
+
+    def _load_all(self):
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.configs))) as pool:
+            list(pool.map(self._load_one, self.configs))
+
+        self.startup_seconds = round(time.perf_counter() - started, 3)
+
+        # เรียงตาม config (ลำดับผลลัพธ์เดิม)
+        with self._lock:
+            ordered = {name: self.models[name] for name in self.configs if name in self.models}
+            self.models.clear()
+            self.models.update(ordered)
+
+        if not self.models:
+            raise RuntimeError("No YOLO models loaded.")
+
+        h = hashlib.blake2b(digest_size=8)
+        for name in self.models:
+            info = self.info[name]
+            h.update(f"{name}:{info['backend']}:{info['precision']}:{info['version']};".encode())
+        self.version = h.hexdigest()
+
+        with self._lock:
+            self.state = "ready"
+        self._ready.set()
+
+    def load_in_background(self):
+        threading.Thread(target=self._load_quietly, name="model-loader", daemon=True).start()
+
+    def _load_quietly(self):
+        # error ถูกเก็บไว้ใน state / error แล้ว (ดูที่ /health/ready)
+        try:
+            self.load_all()
+        except Exception:
+            pass
+
+    def status(self) -> dict:
+        return {
+            "ready": self.is_ready,
+            "state": self.state,
+            "loading": self._loading,
+            "error": self.error,
+            "config": self.config_path,
+            "backend": self.options["backend"],
+            "precision": self.options["precision"],
+            "version": self.version,
+            "startup_seconds": self.startup_seconds,
+            "models": self.info,
+        }
+
+
+registry = ModelRegistry(MODEL_CONFIG_PATH)
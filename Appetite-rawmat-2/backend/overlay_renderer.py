@@ -0,0 +1,156 @@
+# ===============================
+# overlay_renderer.py
+# ===============================
+# วาด overlay (mask + กรอบ + label) จาก detections ที่เก็บไว้
+# - กล่องทั้งโมเดลเป็น array เดียว → scale ทีเดียว, วาดกรอบทุกกล่องด้วย polylines ครั้งเดียว
+# - วาดลง buffer ที่ใช้ซ้ำต่อ thread (ไม่ allocate ภาพใหม่ทุก request)
+# - render แบบย่อได้ (width / scale) → ภาพเล็กไม่วาด label (อ่านไม่ออกอยู่แล้ว)
+# ===============================
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+MASK_ALPHA = 0.5
+
+# label ต่อกล่อง: เกินจำนวนนี้วาดแค่กรอบ (ถาดถั่วหลายร้อยเม็ด)
+MAX_LABELS = int(os.getenv("QC_OVERLAY_MAX_LABELS", 300))
+# ภาพที่ render กว้างน้อยกว่านี้ไม่วาด label
+LABEL_MIN_WIDTH = int(os.getenv("QC_OVERLAY_LABEL_MIN_WIDTH", 480))
+
+DEFAULT_BGR = (255, 255, 255)
+
+
+# ===============================
+# Mask label map (RLE)
+# ===============================
+
+def rle_encode(label: np.ndarray) -> list[int]:
+    """label map → [ค่า, ความยาว, ค่า, ความยาว, ...] (เรียงตามแถว)"""
+    flat = label.ravel()
+    starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+    lengths = np.diff(np.concatenate((starts, [flat.size])))
+    return np.stack([flat[starts], lengths], axis=1).ravel().tolist()
+
+
+def rle_decode(counts: list[int], width: int, height: int) -> np.ndarray:
+    pairs = np.asarray(counts, dtype=np.int64).reshape(-1, 2)
+    return np.repeat(pairs[:, 0], pairs[:, 1]).astype(np.uint8).reshape(height, width)
+
+
+# ===============================
+# Renderer
+# ===============================
+
+class OverlayRenderer:
+
+    def __init__(self, configs: dict):
+        # model_name → {"bgr": ...} (MODEL_CONFIGS)
+        self.configs = configs
+        self._local = threading.local()
+
+    def _color(self, model_name: str) -> tuple:
+        return tuple(self.configs.get(model_name, {}).get("bgr", DEFAULT_BGR))
+
+    def _buffer(self, width: int, height: int) -> np.ndarray:
+        buf = getattr(self._local, "buffer", None)
+        if buf is None or buf.shape[:2] != (height, width):
+            buf = self._local.buffer = np.empty((height, width, 3), dtype=np.uint8)
+        return buf
+
+    def render(
+        self,
+        img: np.ndarray,
+        detections: dict,
+        width: int | None = None,
+        scale: float | None = None,
+    ) -> np.ndarray:
+        """
+        img: ภาพ raw (BGR) ขนาดใดก็ได้ → กล่อง (พิกัดของ image_size) scale ตามขนาดที่วาดจริง
+        width / scale: ย่อภาพก่อนวาด (ไม่ขยายเกินขนาด img)
+        return: buffer ของ thread นี้ → encode / copy ก่อนเรียก render ครั้งถัดไปใน thread เดียวกัน
+        """
+        h, w = img.shape[:2]
+
+        if width:
+            scale = width / w
+        scale = min(1.0, scale or 1.0)
+
+        out_w, out_h = max(1, round(w * scale)), max(1, round(h * scale))
+        overlay = self._buffer(out_w, out_h)
+
+        if (out_w, out_h) == (w, h):
+            np.copyto(overlay, img)
+        else:
+            cv2.resize(img, (out_w, out_h), dst=overlay, interpolation=cv2.INTER_AREA)
+
+        # โหมดน้ำหนัก: ระบายสี mask ทุก class ในการ blend ครั้งเดียว
+        mask = detections.get("mask")
+        if mask:
+            self._blend_mask(overlay, mask)
+
+        src_w, src_h = detections.get("image_size") or [w, h]
+        self._draw_boxes(overlay, detections.get("models", {}), out_w / src_w, out_h / src_h)
+
+        return overlay
+
+    def _blend_mask(self, overlay: np.ndarray, mask: dict):
+        """label map (RLE) → สีของแต่ละ class แล้ว alpha blend ลง overlay ในที่ (1 composite)"""
+        label = rle_decode(mask["rle"], *mask["size"])
+        label = cv2.resize(
+            label, (overlay.shape[1], overlay.shape[0]), interpolation=cv2.INTER_NEAREST
+        )
+
+        # index 0 = พื้นหลัง
+        lut = np.array(
+            [(0, 0, 0)] + [self._color(c) for c in mask["classes"]], dtype=np.uint8
+        )
+
+        blended = cv2.addWeighted(overlay, 1 - MASK_ALPHA, lut[label], MASK_ALPHA, 0)
+        np.copyto(overlay, blended, where=(label > 0)[..., None])
+
+    def _draw_boxes(self, overlay: np.ndarray, models: dict, sx: float, sy: float):
+        total = sum(len(det["xyxy"]) for det in models.values())
+        with_labels = overlay.shape[1] >= LABEL_MIN_WIDTH and total <= MAX_LABELS
+
+        thickness = 2 if overlay.shape[1] >= LABEL_MIN_WIDTH else 1
+        font_scale = 0.5 * min(1.0, max(sx, 0.6))
+
+        for model_name, det in models.items():
+
+            if not det["xyxy"]:
+                continue
+
+            color = self._color(model_name)
+
+            # (N, 4) → scale ทั้งโมเดลทีเดียว
+            xyxy = np.asarray(det["xyxy"], dtype=np.float32)
+            xyxy *= (sx, sy, sx, sy)
+            xyxy = xyxy.astype(np.int32)
+
+            # กรอบทุกกล่อง = polylines ครั้งเดียว
+            x1, y1, x2, y2 = xyxy.T
+            corners = np.stack(
+                [np.stack([x1, y1], 1), np.stack([x2, y1], 1),
+                 np.stack([x2, y2], 1), np.stack([x1, y2], 1)],
+                axis=1,
+            )
+            cv2.polylines(overlay, list(corners), True, color, thickness)
+
+            if not with_labels:
+                continue
+
+            for (lx, ly), conf_val in zip(
+                np.stack([x1, np.maximum(y1 - 6, 12)], 1).tolist(), det["conf"]
+            ):
+                cv2.putText(
+                    overlay,
+                    f"{model_name} {conf_val:.2f}",
+                    (lx, ly),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale,
+                    color,
+                    thickness,
+                )
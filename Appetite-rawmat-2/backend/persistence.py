@@ -0,0 +1,257 @@
+# ===============================
+# persistence.py
+# ===============================
+# write-behind: เก็บผล QC (upload raw + insert DB) เบื้องหลัง
+# - endpoint ตอบ client ทันทีด้วย job_id (provisional id)
+# - งานถูกเขียนลง spool บนดิสก์ก่อน (fsync) → restart / ไฟดับแล้วไม่หาย
+# - upload / insert ล้มเหลว → retry แบบ exponential backoff
+# - upload กับ insert ยิงพร้อมกัน (database.async_client) ไม่ต่อคิวกัน
+# ===============================
+
+import asyncio
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from database.async_client import async_db
+from storage.storage import upload_image_async
+from qc_service import save_qc_result_async
+from metrics import timed
+
+SPOOL_DIR = os.getenv(
+    "QC_SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "spool")
+)
+RETRY_BASE_SECONDS = float(os.getenv("QC_RETRY_BASE_SECONDS", 1))
+RETRY_MAX_SECONDS = float(os.getenv("QC_RETRY_MAX_SECONDS", 300))
+
+
+class PersistenceQueue:
+
+    def __init__(self, spool_dir: str):
+        self.spool_dir = spool_dir
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+        # heap ของ (เวลาที่ถึงกำหนด, job_id)
+        self._heap = []
+        self._cond = threading.Condition()
+        self._started = False
+
+        self._saved = 0
+        self._retries = 0
+        self._last_error = None
+
+    # ===============================
+    # Spool files
+    # ===============================
+
+    def _image_file(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.jpg")
+
+    def _meta_file(self, job_id: str) -> str:
+        return os.path.join(self.spool_dir, f"{job_id}.json")
+
+    def _fsync_dir(self):
+        # rename ต้อง fsync โฟลเดอร์ด้วยถึงจะถาวร (Windows เปิดโฟลเดอร์แบบนี้ไม่ได้ → ข้าม)
+        try:
+            fd = os.open(self.spool_dir, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _write_meta(self, job: dict):
+        tmp = self._meta_file(job["job_id"]) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._meta_file(job["job_id"]))
+        self._fsync_dir()
+
+    def _read_meta(self, job_id: str) -> dict | None:
+        try:
+            with open(self._meta_file(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _remove(self, job_id: str):
+        for path in (self._image_file(job_id), self._meta_file(job_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    # ===============================
+    # Public API
+    # ===============================
+
+    def enqueue(self, raw_path: str, image_bytes: bytes, result: dict) -> dict:
+        """
+        เขียนงานลง spool แล้วคืนค่า provisional ทันที
+        return: {"job_id", "created_at"}
+        """
+        job_id = uuid.uuid4().hex
+        created_at = datetime.now(timezone.utc).isoformat()
+
+        # รูปก่อน แล้ว json ทีหลัง → มี json = งานครบ
+        with open(self._image_file(job_id), "wb") as f:
+            f.write(image_bytes)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._write_meta({
+            "job_id": job_id,
+            "raw_path": raw_path,
+            "created_at": created_at,
+            "uploaded": False,
+            "saved": False,
+            "attempts": 0,
+            "result": {
+                "total_count": result["total_count"],
+                "status": result["status"],
+                "items": result["items"],
+                "detections": result.get("detections"),
+            },
+        })
+
+        self._schedule(job_id, 0)
+        return {"job_id": job_id, "created_at": created_at}
+
+    def is_pending(self, job_id: str) -> bool:
+        """งานยังอยู่ใน spool (ยัง upload / บันทึกไม่ครบ)"""
+        return job_id.isalnum() and os.path.exists(self._meta_file(job_id))
+
+    def pending_job(self, job_id: str):
+        """
+        งานที่ยังไม่ถูกบันทึก → (raw image bytes, detections) หรือ None
+        ใช้ render overlay ระหว่างรอ upload
+        """
+        job = self._read_meta(job_id) if job_id.isalnum() else None
+        if job is None:
+            return None
+        try:
+            with open(self._image_file(job_id), "rb") as f:
+                return f.read(), job["result"].get("detections")
+        except FileNotFoundError:
+            return None
+
+    def start(self):
+        """เริ่ม worker + โหลดงานค้างใน spool (ตอน restart)"""
+        if self._started:
+            return
+        self._started = True
+
+        for name in sorted(os.listdir(self.spool_dir)):
+            if name.endswith(".json"):
+                self._schedule(name[:-len(".json")], 0)
+
+        threading.Thread(target=self._worker, name="qc-persist", daemon=True).start()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "pending": len(self._heap),
+                "saved": self._saved,
+                "retries": self._retries,
+                "last_error": self._last_error,
+            }
+
+    # ===============================
+    # Worker
+    # ===============================
+
+    def _schedule(self, job_id: str, delay: float):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, job_id))
+            self._cond.notify()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                _, job_id = heapq.heappop(self._heap)
+
+            job = self._read_meta(job_id)
+            if job is None:
+                continue
+
+            try:
+                self._process(job)
+            except Exception as e:
+                job["attempts"] += 1
+                self._write_meta(job)
+
+                delay = min(RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1), RETRY_MAX_SECONDS)
+                print(f"❌ Persist {job_id} failed (attempt {job['attempts']}), retry in {delay:.0f}s:", e)
+
+                with self._cond:
+                    self._retries += 1
+                    self._last_error = str(e)
+                self._schedule(job_id, delay)
+                continue
+
+            self._remove(job_id)
+            with self._cond:
+                self._saved += 1
+
+    def _process(self, job: dict):
+        """
+        upload RAW + บันทึก DB พร้อมกัน (path รู้ล่วงหน้า ไม่ต้องรอกัน)
+        ขั้นที่สำเร็จแล้วถูกจดไว้ใน meta → retry ทำเฉพาะขั้นที่ยังไม่ผ่าน
+        """
+        try:
+            async_db.call(self._persist(job))
+        finally:
+            self._write_meta(job)
+
+    async def _persist(self, job: dict):
+        steps = []
+
+        if not job["uploaded"]:
+            steps.append(self._upload(job))
+        if not job.get("saved"):
+            steps.append(self._save(job))
+
+        results = await asyncio.gather(*steps, return_exceptions=True)
+
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            raise errors[0]
+
+    async def _upload(self, job: dict):
+        # ===============================
+        # 1. Upload RAW image (ครั้งเดียว)
+        # ===============================
+        with open(self._image_file(job["job_id"]), "rb") as f:
+            image_bytes = f.read()
+
+        with timed("upload"):
+            await upload_image_async(image_bytes, job["raw_path"], "raw", path=job["raw_path"])
+
+        job["uploaded"] = True
+
+    async def _save(self, job: dict):
+        # ===============================
+        # 2. Save to database (upsert ด้วย job_id → ซ้ำได้)
+        # ===============================
+        with timed("db_save"):
+            await save_qc_result_async(
+                job["raw_path"],
+                job["result"],
+                job_id=job["job_id"],
+                created_at=job["created_at"],
+            )
+
+        job["saved"] = True
+
+
+persistence_queue = PersistenceQueue(SPOOL_DIR)
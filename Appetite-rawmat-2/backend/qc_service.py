@@ -3,77 +3,278 @@
 # ===============================
 # โมดูลสำหรับ:
 # - รัน QC ด้วย YOLO Segmentation (Triple Model)
-# - นับจำนวนวัตถุดิบแทนน้ำหนัก
+# - นับจำนวนวัตถุดิบ (QC_MODE=count) หรือประมาณน้ำหนักจากพื้นที่ mask (QC_MODE=weight)
 # - บันทึกผล QC ลง Supabase
 # ===============================
 
-from ultralytics import YOLO
 import numpy as np
 import cv2
-from PIL import Image, ImageOps
-import io
-from database.supabase import supabase
-
-# ===============================
-# MODEL CONFIG
-# ===============================
-
-MODEL_CONFIGS = {
-    "Potato": {
-        "path": r"D:\I-Tail\AI-food_production\potato.pt",
-        "bgr": (246, 254, 3),
-        "hex": "#03FEF6"
-    },
-    "Peas": {
-        "path": r"D:\I-Tail\AI-food_production\peas.pt",
-        "bgr": (21, 210, 21),
-        "hex": "#15D215"
-    },
-    "Carrot": {
-        "path": r"D:\I-Tail\AI-food_production\carrot.pt",
-        "bgr": (0, 165, 255),
-        "hex": "#FFA500"
-    }
-}
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from database.async_client import async_db
+from imaging import decode_image_reduced, to_bgr, encode_jpeg, encode_png, encode_webp
+from storage.storage import download_image, upload_image
+from collections import OrderedDict
+from model_registry import registry
+from result_cache import image_digest
+from metrics import timed
+from overlay_renderer import OverlayRenderer, rle_encode
 
 # ===============================
-# LOAD ALL MODELS (โหลดครั้งเดียว)
+# MODEL CONFIG / REGISTRY
+# ===============================
+# path / สีของแต่ละโมเดลอยู่ใน models.yaml (model_registry.py)
+# โมเดลโหลดตอน startup ของ app (registry.load_in_background)
+# ไม่ใช่ตอน import module นี้
 # ===============================
 
-models = {}
+MODEL_CONFIGS = registry.configs
 
-for name, cfg in MODEL_CONFIGS.items():
-    try:
-        models[name] = YOLO(cfg["path"])
-        print(f"[OK] Loaded model: {name}")
-    except Exception as e:
-        print(f"[FAIL] {name}: {e}")
+# เติมโดย registry.load_all() (dict เดียวกัน)
+models = registry.models
+
+overlay_renderer = OverlayRenderer(MODEL_CONFIGS)
+
+# ===============================
+# ENSEMBLE EXECUTOR
+# ===============================
+# รันทุกโมเดลพร้อมกันบนภาพเดียว แทนการรันทีละโมเดล
+# - QC_ENSEMBLE_WORKERS   : จำนวน thread ที่ dispatch โมเดล (default = จำนวนโมเดล)
+# - QC_TORCH_THREADS      : intra-op thread pool ของ torch (ค่าเดียวทั้ง process
+#   ทุกโมเดลใช้ pool เดียวกัน ไม่ใช่ต่อโมเดล / ต่อ thread)
+#   default = CPU ทั้งหมดหารด้วยจำนวนโมเดล → โมเดลที่รันพร้อมกันไม่แย่ง core กันเอง
+#   (QC_THREADS_PER_MODEL = ชื่อเดิม ยังอ่านได้)
+# ===============================
+
+QC_CONF = 0.25
+
+# ขนาด input ของโมเดล (0 = ตามที่โมเดลเทรน / export มา)
+QC_IMGSZ = int(os.getenv("QC_IMGSZ", 0))
+_PREDICT_KWARGS = {"imgsz": QC_IMGSZ} if QC_IMGSZ else {}
+
+ENSEMBLE_WORKERS = int(os.getenv("QC_ENSEMBLE_WORKERS", len(MODEL_CONFIGS)))
+TORCH_THREADS = int(
+    os.getenv("QC_TORCH_THREADS")
+    or os.getenv("QC_THREADS_PER_MODEL")
+    or max(1, (os.cpu_count() or 1) // max(1, len(MODEL_CONFIGS)))
+)
+
+
+def configure_cpu_threads():
+    """
+    ตั้ง torch thread pool ของทั้ง process ครั้งเดียวตอน startup (ก่อนโหลดโมเดล)
+    เรียกจาก main.py / benchmark_qc.py คู่กับการสร้าง pool ต่าง ๆ
+    """
+    torch.set_num_threads(TORCH_THREADS)
+    print(f"⚙️ torch threads (process-wide): {TORCH_THREADS}, ensemble workers: {ENSEMBLE_WORKERS}")
+
+ensemble_executor = ThreadPoolExecutor(
+    max_workers=max(1, ENSEMBLE_WORKERS),
+    thread_name_prefix="qc-model",
+)
+
+# YOLO object ไม่ thread-safe → 1 lock ต่อโมเดล
+# (โมเดลต่างตัวรันขนานกันได้ แต่โมเดลเดียวกันห้ามเรียกซ้อน)
+model_locks = {name: threading.Lock() for name in MODEL_CONFIGS}
+
+
+def _predict(model_name: str, source, timings: dict | None = None):
+    with model_locks[model_name]:
+        # จับเวลาเฉพาะ forward pass (ไม่รวมเวลารอ lock)
+        with timed(f"model.{model_name}", timings):
+            return models[model_name](source, conf=QC_CONF, verbose=False, **_PREDICT_KWARGS)
+
+
+def run_ensemble(source, timings: dict | None = None) -> dict:
+    """
+    dispatch ทุกโมเดลเข้า ensemble_executor พร้อมกัน
+    return: {model_name: results list} เรียงตาม MODEL_CONFIGS
+    raise ModelsNotReady ถ้ายังโหลด / warmup ไม่เสร็จ
+    timings: dict ของ request → ได้ "model.<name>" + "inference" (ms)
+    """
+    registry.wait_ready(timeout=0)
+
+    with timed("inference", timings):
+        futures = {
+            name: ensemble_executor.submit(_predict, name, source, timings)
+            for name in models
+        }
+        return {name: f.result() for name, f in futures.items()}
+
+# ===============================
+# QC MODE
+# ===============================
+# - "count"  : นับจำนวนชิ้นต่อโมเดล (แบบเดิม)
+# - "weight" : พื้นที่ mask → cm² → กรัม (calibration จาก weight: ใน models.yaml)
+# ===============================
+
+QC_MODE = os.getenv("QC_MODE", "count")
+
+WEIGHT_CONFIG = registry.options.get("weight") or {}
+PIXEL_PER_CM = float(WEIGHT_CONFIG.get("pixel_per_cm", 37.2))
+# ความกว้างภาพ (px) ตอนวัด pixel_per_cm → ใช้ปรับ ppc ตามขนาดภาพที่เข้ามาจริง
+# (JPEG ถูก decode แบบย่อ, PNG / กล้องเต็มขนาด → ขนาดไม่เท่ากัน)
+CALIB_WIDTH = float(WEIGHT_CONFIG.get("calib_width") or 0)
+THICKNESS_CM = float(WEIGHT_CONFIG.get("thickness_cm", 3))
+# g/cm³ ตาม dataset_class ของแต่ละโมเดล (ไม่มีในตาราง = 1.0)
+DENSITY_TABLE = WEIGHT_CONFIG.get("density") or {}
+WEIGHT_SPEC = {"min": 45, "max": 50, **(WEIGHT_CONFIG.get("spec") or {})}
+
+if QC_MODE == "weight" and CALIB_WIDTH <= 0:
+    raise Exception("QC_MODE=weight requires weight.calib_width in models.yaml")
+
+# mask ที่เก็บไว้ render overlay: ด้านยาว (px) ของ label map
+MASK_STORE_SIZE = int(os.getenv("QC_MASK_STORE_SIZE", 256))
+
+# ส่วนหนึ่งของ cache key (เปลี่ยนโหมด / calibration → ผลเดิมใช้ไม่ได้)
+_MODE_TAG = QC_MODE if QC_MODE != "weight" else (
+    "weight." + hashlib.blake2b(
+        json.dumps(WEIGHT_CONFIG, sort_keys=True).encode(), digest_size=4
+    ).hexdigest()
+)
+
+
+def _mask_area(results, img_h: int, img_w: int) -> tuple[float, np.ndarray | None]:
+    """
+    พื้นที่ mask รวมของโมเดลเดียว (หน่วย pixel ของภาพที่ใช้ inference) + mask รวม (union)
+    คิดทีเดียวทั้ง tensor (N, mh, mw) ที่ความละเอียดของโมเดล แล้ว scale ด้วยสูตร
+    ไม่ resize mask ทีละชิ้นขึ้นไปเท่าภาพ
+    ไม่มี mask (โมเดล detect) → ใช้พื้นที่กล่องแทน
+    """
+    if results.masks is None:
+        xyxy = results.boxes.xyxy.cpu().numpy()
+        return float(((xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])).sum()), None
+
+    # mask อยู่ในพิกัด input ของโมเดล (letterbox) → ตัด padding ออกก่อน
+    data = results.masks.data
+    mh, mw = data.shape[1:]
+    gain = min(mh / img_h, mw / img_w)
+    pad_w = (mw - img_w * gain) / 2
+    pad_h = (mh - img_h * gain) / 2
+    top, left = int(round(pad_h - 0.1)), int(round(pad_w - 0.1))
+    bottom, right = int(round(mh - pad_h + 0.1)), int(round(mw - pad_w + 0.1))
+
+    binary = data[:, top:bottom, left:right] > 0.5
+
+    # รวมพื้นที่ทุก instance (ส่วนที่ซ้อนกันนับซ้ำ เหมือนตอน calibrate ใน test.py)
+    pixels = float(binary.sum())
+    union = binary.any(dim=0).cpu().numpy()
+
+    # 1 pixel ของ mask = 1 / gain² pixel ของภาพ
+    return pixels / (gain * gain), union
+
+
+def _label_map(unions: dict, img_h: int, img_w: int) -> dict | None:
+    """
+    mask รวมของทุกโมเดล → label map ขนาดเล็ก 1 ชั้น (0 = พื้นหลัง, i = classes[i - 1])
+    เก็บเป็น RLE ใน detections → render overlay ทีหลังได้โดยไม่ต้องรันโมเดลใหม่
+    """
+    if not unions:
+        return None
+
+    scale = min(1.0, MASK_STORE_SIZE / max(img_h, img_w))
+    w, h = max(1, round(img_w * scale)), max(1, round(img_h * scale))
+
+    label = np.zeros((h, w), dtype=np.uint8)
+    classes = []
+
+    for model_name, union in unions.items():
+        classes.append(model_name)
+        resized = cv2.resize(union.astype(np.uint8), (w, h), interpolation=cv2.INTER_NEAREST)
+        label[resized > 0] = len(classes)
+
+    return {"size": [w, h], "classes": classes, "rle": rle_encode(label)}
+
+
+def _weight_items(img: np.ndarray, results_by_model: dict, detections: dict) -> tuple[float, list]:
+    """
+    พื้นที่ mask → น้ำหนัก (กรัม) ต่อโมเดล
+    weight = area_cm2 × THICKNESS_CM × density(dataset_class)
+    return: (น้ำหนักรวม, items) + เติม detections["mask"]
+    """
+    h, w = img.shape[:2]
+
+    # pixel_per_cm วัดที่ความกว้าง CALIB_WIDTH → แปลงเป็นของภาพนี้
+    # (ภาพเดียวกันขนาดไหนก็ได้กรัมเท่ากัน)
+    ppc = PIXEL_PER_CM * w / CALIB_WIDTH
+
+    weights = {}
+    unions = {}
+
+    for model_name, results in results_by_model.items():
+
+        if results.boxes is None:
+            continue
+
+        area_px, union = _mask_area(results, h, w)
+        if union is not None:
+            unions[model_name] = union
+
+        area_cm2 = area_px / (ppc * ppc)
+        density = DENSITY_TABLE.get(MODEL_CONFIGS[model_name].get("dataset_class", model_name), 1.0)
+
+        weights[model_name] = (len(results.boxes), area_cm2, area_cm2 * THICKNESS_CM * density)
+
+    mask = _label_map(unions, h, w)
+    if mask:
+        detections["mask"] = mask
+
+    total_weight = sum(weight for _, _, weight in weights.values())
+
+    items = []
+
+    for class_name, (instances, area_cm2, weight) in weights.items():
+
+        ratio = (weight / total_weight * 100) if total_weight > 0 else 0
+
+        items.append({
+            "class": class_name,
+            # count ใน DB = กรัม (int) สำหรับโหมดน้ำหนัก
+            "count": round(weight),
+            "ratio": round(ratio, 2),
+            "color": MODEL_CONFIGS[class_name]["hex"],
+            "instances": instances,
+            "area_cm2": round(area_cm2, 2),
+            "weight_g": round(weight, 2),
+        })
+
+    return total_weight, items
 
-if not models:
-    raise RuntimeError("No YOLO models loaded.")
 
 # ===============================
 # MAIN QC FUNCTION
 # ===============================
 
-def run_qc(image_bytes: bytes) -> dict:
+def _as_bgr(image, is_rgb: bool = False) -> np.ndarray:
+    """
+    รับได้ทั้ง ndarray ที่ decode แล้ว (BGR หรือ RGB) และ bytes (ทางเก่า)
+    bytes JPEG → decode แบบย่อใกล้ขนาด input ของโมเดล
+    """
+    if isinstance(image, np.ndarray):
+        return to_bgr(image, is_rgb)
+    return decode_image_reduced(image)[0]
 
-    pil_img = Image.open(io.BytesIO(image_bytes))
-    pil_img = ImageOps.exif_transpose(pil_img)
-    # pil_img = pil_img.convert("RGB").resize((640, 640), Image.BILINEAR)
-    pil_img = pil_img.convert("RGB")
 
+def _build_result(img: np.ndarray, results_by_model: dict) -> dict:
+    """
+    รวมผลของทุกโมเดล (1 ภาพ) เป็น dict รูปแบบเดียวกับ run_qc
+    results_by_model: {model_name: ultralytics Results ของภาพนี้}
+    ไม่วาด overlay ที่นี่ → เก็บ detections ไว้ render ทีหลังเมื่อมีคนเปิดดู
+    พิกัดกล่องเป็นของภาพที่ใช้ inference (image_size) ซึ่งอาจเล็กกว่าไฟล์ raw
+    → ขยายกลับเฉพาะตอน render (render_overlay)
+    """
 
-    img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-    overlay = img.copy()
+    h, w = img.shape[:2]
 
     total_count = 0
     count_per_class = {}
+    detections = {"image_size": [w, h], "models": {}}
 
-    # 🔥 รันทุกโมเดล
-    for model_name, model in models.items():
-
-        results = model(img, conf=0.25)[0]
+    for model_name, results in results_by_model.items():
 
         if results.boxes is None:
             continue
@@ -83,23 +284,26 @@ def run_qc(image_bytes: bytes) -> dict:
         count_per_class[model_name] = count
         total_count += count
 
-        cfg = MODEL_CONFIGS[model_name]
-
-        # วาดกรอบ
-        for box in results.boxes:
-            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-            conf_val = float(box.conf[0])
+        # ย้าย box + conf (+ cls) ทั้งโมเดลมา host ใน transfer เดียว
+        data = results.boxes.data.cpu().numpy()
+        detections["models"][model_name] = {
+            "xyxy": data[:, :4].round().astype(int).tolist(),
+            "conf": data[:, 4].round(3).tolist(),
+        }
 
-            cv2.rectangle(overlay, (x1, y1), (x2, y2), cfg["bgr"], 2)
-            cv2.putText(
-                overlay,
-                f"{model_name} {conf_val:.2f}",
-                (x1, max(y1 - 6, 12)),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
-                cfg["bgr"],
-                2
-            )
+    if QC_MODE == "weight":
+        total_weight, items = _weight_items(img, results_by_model, detections)
+        status = "PASS" if WEIGHT_SPEC["min"] <= total_weight <= WEIGHT_SPEC["max"] else "FAIL"
+
+        return {
+            "mode": "weight",
+            "total_count": round(total_weight),
+            "total_weight_g": round(total_weight, 2),
+            "status": status,
+            "spec": {"min": WEIGHT_SPEC["min"], "max": WEIGHT_SPEC["max"]},
+            "items": items,
+            "detections": detections,
+        }
 
     # ===============================
     # Build Items
@@ -125,52 +329,189 @@ def run_qc(image_bytes: bytes) -> dict:
     qc_min, qc_max = 10, 100  # 🔥 ปรับตามหน้างานจริง
     status = "PASS" if qc_min <= total_count <= qc_max else "FAIL"
 
-    # ===============================
-    # Convert overlay to bytes
-    # ===============================
-
-    overlay_rgb = cv2.cvtColor(overlay, cv2.COLOR_BGR2RGB)
-    overlay_pil = Image.fromarray(overlay_rgb)
-    buf = io.BytesIO()
-    overlay_pil.save(buf, format="PNG")
-
     return {
+        "mode": "count",
         "total_count": total_count,
         "status": status,
         "spec": {"min": qc_min, "max": qc_max},
         "items": items,
-        "overlay_image": buf.getvalue()
+        "detections": detections,
     }
 
+
+def qc_cache_key(img: np.ndarray) -> str | None:
+    """
+    key ของ result cache: pixel ที่ decode แล้ว + version โมเดล + conf + imgsz + โหมด
+    (เปลี่ยน weights / backend / precision / conf / calibration → key ใหม่เอง)
+    None = โมเดลยังโหลดไม่เสร็จ (ยังไม่รู้ version) → ข้าม cache
+    """
+    if registry.version is None:
+        return None
+    return f"{image_digest(img)}-{registry.version}-{QC_CONF}-{QC_IMGSZ}-{_MODE_TAG}"
+
+
+def run_qc(image, is_rgb: bool = False, timings: dict | None = None) -> dict:
+    """
+    image: numpy BGR (default) / RGB (is_rgb=True) หรือ bytes ของไฟล์ภาพ
+    timings: dict ของ request สำหรับเก็บเวลาแต่ละขั้น (ms) → Server-Timing
+    """
+
+    with timed("run_qc", timings):
+        img = _as_bgr(image, is_rgb)
+
+        # 🔥 รันทุกโมเดลพร้อมกัน แล้วค่อยรวมผล (ลำดับเดิม)
+        results_by_model = {
+            name: model_results[0]
+            for name, model_results in run_ensemble(img, timings).items()
+        }
+
+        with timed("postprocess", timings):
+            return _build_result(img, results_by_model)
+
+
+# ===============================
+# BATCH QC (หลายภาพ → 1 predict call ต่อโมเดล)
+# ===============================
+
+# decode / สรุปผลทำขนานกันทีละภาพ (cv2, PIL ปล่อย GIL)
+IMAGE_WORKERS = int(os.getenv("QC_IMAGE_WORKERS", min(4, os.cpu_count() or 1)))
+
+image_executor = ThreadPoolExecutor(
+    max_workers=max(1, IMAGE_WORKERS),
+    thread_name_prefix="qc-image",
+)
+
+
+def run_qc_batch(images: list, is_rgb: bool = False, timings: dict | None = None) -> list[dict]:
+    """
+    รัน QC หลายภาพพร้อมกัน
+    - แต่ละโมเดลถูกเรียกครั้งเดียวด้วย list ของภาพ (batched forward pass)
+    images: list ของ ndarray (หรือ bytes) แบบเดียวกับ run_qc
+    timings: เหมือน run_qc (เวลารวมของทั้ง batch)
+    return: list ผลลัพธ์รูปแบบเดียวกับ run_qc เรียงตาม input
+    """
+
+    if not images:
+        return []
+
+    with timed("run_qc", timings):
+        imgs = list(image_executor.map(lambda im: _as_bgr(im, is_rgb), images))
+
+        batched = run_ensemble(imgs, timings)
+
+        with timed("postprocess", timings):
+            return list(image_executor.map(
+                lambda i: _build_result(
+                    imgs[i],
+                    {name: model_results[i] for name, model_results in batched.items()},
+                ),
+                range(len(imgs)),
+            ))
+
 # ===============================
 # SAVE RESULT TO SUPABASE
 # ===============================
 
-def save_qc_result(image_name: str, result: dict):
+# QC_SAVE_MODE
+# - "rpc"  : เรียก function save_qc_result ใน Postgres ครั้งเดียว
+#            (header + items ใน transaction เดียว, migration 003)
+# - "bulk" : insert header แล้ว insert items ทั้งหมดในคำสั่งเดียว
+QC_SAVE_MODE = os.getenv("QC_SAVE_MODE", "rpc")
+
+
+def save_qc_result(
+    image_name: str,
+    result: dict,
+    job_id: str | None = None,
+    created_at: str | None = None,
+) -> dict:
+    """
+    บันทึก qc_result + qc_item (เรียกจาก thread ธรรมดา)
+    job_id: id ของงาน write-behind → upsert ซ้ำได้ (retry ไม่เกิด row ซ้ำ)
+    created_at: เวลาที่ตรวจจริง (ถ้าไม่ส่ง DB ใส่เวลาปัจจุบันเอง)
+    return: row ของ qc_result (มี id_qc, created_at)
+    """
+    return async_db.call(save_qc_result_async(image_name, result, job_id, created_at))
+
+
+async def save_qc_result_async(
+    image_name: str,
+    result: dict,
+    job_id: str | None = None,
+    created_at: str | None = None,
+) -> dict:
+    """
+    เหมือน save_qc_result แต่เป็น coroutine (รันบน loop ของ database.async_client)
+    ยิงผ่าน HTTP client ที่ pool ร่วมกับ storage → รันพร้อม upload ได้
+    """
+    header, items = _qc_payload(image_name, result, job_id, created_at)
+
+    # ===============================
+    # 1 round trip: header + items ใน transaction
+    # ===============================
+    if QC_SAVE_MODE == "rpc":
+        data = await async_db.rpc("save_qc_result", {"p_header": header, "p_items": items})
+
+        if not data:
+            raise Exception(f"save_qc_result rpc failed: {data}")
+
+        return {"id_qc": data["id_qc"], "created_at": data["created_at"]}
+
+    # ===============================
+    # bulk: header 1 ครั้ง + items 1 ครั้ง
+    # ===============================
+    rows = await async_db.insert(
+        "qc_result", header, on_conflict="job_id" if job_id else None
+    )
+
+    if not rows:
+        raise Exception(f"Insert qc_result failed: {rows}")
+
+    qc_row = rows[0]
+    qc_id = qc_row["id_qc"]
+
+    # retry รอบก่อนอาจใส่ item ไปแล้ว
+    if job_id:
+        await async_db.delete("qc_item", [("qc_id", f"eq.{qc_id}")])
+
+    if items:
+        await async_db.insert("qc_item", [{"qc_id": qc_id, **item} for item in items])
+
+    return {"id_qc": qc_id, "created_at": qc_row["created_at"]}
 
-    qc = supabase.table("qc_result").insert({
+
+def _qc_payload(
+    image_name: str,
+    result: dict,
+    job_id: str | None,
+    created_at: str | None,
+) -> tuple[dict, list[dict]]:
+    """(header ของ qc_result, items ของ qc_item)"""
+
+    header = {
         "image_name": image_name,
         "total_count": result["total_count"],
         "status": result["status"],
         "total_item": len(result["items"]),
-    }).execute()
+        "detections": result.get("detections"),
+    }
 
-    if not qc.data:
-        raise Exception(f"Insert qc_result failed: {qc}")
+    if created_at:
+        header["created_at"] = created_at
 
-    qc_row = qc.data[0]
-    qc_id = qc_row["id_qc"]
-    created_at = qc_row["created_at"]
+    if job_id:
+        header["job_id"] = job_id
 
-    for item in result["items"]:
-        supabase.table("qc_item").insert({
-            "qc_id": qc_id,
+    items = [
+        {
             "class": item["class"],
             "count": item["count"],
             "ratio": item["ratio"],
-        }).execute()
+        }
+        for item in result["items"]
+    ]
 
-    return created_at
+    return header, items
 
 # ===============================
 # GET QC HISTORY
@@ -178,25 +519,11 @@ def save_qc_result(image_name: str, result: dict):
 
 def get_qc_history():
 
-    res = (
-        supabase
-        .table("qc_result")
-        .select("""
-            id_qc,
-            image_name,
-            total_count,
-            status,
-            created_at,
-            qc_item (
-                class,
-                count,
-                ratio
-            )
-        """)
-        .order("created_at", desc=True)
-        .limit(100)
-        .execute()
-    )
+    rows = async_db.call(async_db.select("qc_result", [
+        ("select", "id_qc,image_name,total_count,status,created_at,qc_item(class,count,ratio)"),
+        ("order", "created_at.desc"),
+        ("limit", "100"),
+    ]))
 
     return [
         {
@@ -207,5 +534,180 @@ def get_qc_history():
             "created_at": r["created_at"],
             "items": r.get("qc_item", []),
         }
-        for r in res.data
+        for r in rows
     ]
+
+# ===============================
+# QC STATS (อ่านจาก rollup ไม่ scan qc_result)
+# ===============================
+
+# period ที่ใช้แตกย่อยในแต่ละ range
+STATS_BREAKDOWN = {
+    "day": None,
+    "week": "day",
+    "month": "day",
+    "year": "month",
+}
+
+
+def _rollup_summary(r: dict) -> dict:
+    n = r["inspections"]
+
+    return {
+        "period_type": r["period_type"],
+        "period_start": r["period_start"],
+        "inspections": n,
+        "pass_count": r["pass_count"],
+        "fail_count": r["fail_count"],
+        "pass_rate": round(r["pass_count"] / n * 100, 2) if n else 0,
+        "total_count_sum": r["total_count_sum"],
+        "avg_total_count": round(r["total_count_sum"] / n, 2) if n else 0,
+        # ค่าเฉลี่ยต่อการตรวจ 1 ครั้ง (ครั้งที่ไม่เจอ class นั้นนับเป็น 0)
+        "items": [
+            {
+                "class": i["class"],
+                "samples": i["samples"],
+                "count_sum": i["count_sum"],
+                "avg_count": round(i["count_sum"] / n, 2) if n else 0,
+                "avg_ratio": round(float(i["ratio_sum"]) / n, 2) if n else 0,
+            }
+            for i in r.get("qc_rollup_item", [])
+        ],
+    }
+
+
+def get_qc_stats(range_type: str, start: str, end: str) -> dict:
+    """
+    สรุปของช่วง [start, end) + แตกย่อยตาม STATS_BREAKDOWN
+    ใช้แถวใน qc_rollup ไม่กี่สิบแถว (ปี = 1 + 12 แถว)
+    """
+
+    period_types = [range_type]
+    breakdown = STATS_BREAKDOWN[range_type]
+    if breakdown:
+        period_types.append(breakdown)
+
+    res = async_db.call(async_db.select("qc_rollup", [
+        ("select",
+         "period_type,period_start,inspections,pass_count,fail_count,total_count_sum,"
+         "qc_rollup_item(class,samples,count_sum,ratio_sum)"),
+        ("period_type", f"in.({','.join(period_types)})"),
+        ("period_start", f"gte.{start}"),
+        ("period_start", f"lt.{end}"),
+        ("order", "period_start"),
+    ]))
+
+    rows = [_rollup_summary(r) for r in res]
+
+    return {
+        "range": range_type,
+        "start": start,
+        "end": end,
+        "summary": next((r for r in rows if r["period_type"] == range_type), None),
+        "breakdown": [r for r in rows if r["period_type"] == breakdown],
+    }
+
+
+# ===============================
+# OVERLAY (render ตอนมีคนขอดูครั้งแรก)
+# ===============================
+
+OVERLAY_FORMATS = {
+    "png": ("image/png", encode_png),
+    "jpeg": ("image/jpeg", encode_jpeg),
+    "webp": ("image/webp", encode_webp),
+}
+
+OVERLAY_CACHE_SIZE = int(os.getenv("QC_OVERLAY_CACHE_SIZE", 64))
+
+# LRU ในหน่วยความจำ: (qc_id, fmt, width) → bytes
+_overlay_cache = OrderedDict()
+_overlay_cache_lock = threading.Lock()
+
+
+def _decode_for_overlay(image_bytes: bytes, width: int | None) -> np.ndarray:
+    """ขอ overlay แบบย่อ → decode JPEG แบบย่อ (draft) ไม่ต้อง decode เต็มแล้ว resize"""
+    return decode_image_reduced(image_bytes, width or 0)[0]
+
+
+def render_overlay(img: np.ndarray, detections: dict, width: int | None = None) -> np.ndarray:
+    """
+    วาด mask / กรอบจาก detections ที่เก็บไว้ลงบนภาพ raw (overlay_renderer)
+    กล่อง (พิกัดของ image_size) ถูก scale ไปตามขนาดภาพที่วาดจริง
+    width: ย่อภาพก่อนวาด (None = ขนาดเต็ม)
+    คืน buffer ที่ใช้ซ้ำของ thread → encode ทันที
+    """
+    return overlay_renderer.render(img, detections, width)
+
+
+def get_qc_overlay(
+    qc_id: str,
+    fmt: str = "png",
+    width: int | None = None,
+    pending=None,
+):
+    """
+    คืน (bytes, content_type) ของ overlay
+    qc_id: id_qc (ตัวเลข) หรือ job_id ของงาน write-behind
+    pending: (raw image bytes, detections) ถ้างานยังอยู่ใน spool
+    ลำดับ: cache ในหน่วยความจำ → ไฟล์ที่เคย render ใน storage → render ใหม่
+    return None ถ้าไม่มี record / detections
+    """
+
+    content_type, encoder = OVERLAY_FORMATS[fmt]
+    key = (qc_id, fmt, width)
+
+    with _overlay_cache_lock:
+        if key in _overlay_cache:
+            _overlay_cache.move_to_end(key)
+            return _overlay_cache[key], content_type
+
+    # ยังไม่ได้บันทึก → render จากไฟล์ใน spool (ไม่ cache ลง storage)
+    if pending is not None:
+        image_bytes, detections = pending
+        if not detections:
+            return None
+        with timed("overlay_render"):
+            overlay = render_overlay(_decode_for_overlay(image_bytes, width), detections, width)
+        with timed(f"overlay_encode_{fmt}"):
+            data = encoder(overlay)
+        return data, content_type
+
+    cache_path = f"overlay/{qc_id}_{width or 'full'}.{fmt}"
+
+    try:
+        data = download_image(cache_path)
+    except Exception:
+        data = None
+
+    if data is None:
+        id_column = "id_qc" if qc_id.isdigit() else "job_id"
+        res = async_db.call(async_db.select("qc_result", [
+            ("select", "image_name,detections"),
+            (id_column, f"eq.{qc_id}"),
+            ("limit", "1"),
+        ]))
+
+        if not res or not res[0].get("detections"):
+            return None
+
+        row = res[0]
+        img = _decode_for_overlay(download_image(row["image_name"]), width)
+
+        with timed("overlay_render"):
+            overlay = render_overlay(img, row["detections"], width)
+        with timed(f"overlay_encode_{fmt}"):
+            data = encoder(overlay)
+
+        try:
+            upload_image(data, cache_path, "overlay", content_type, path=cache_path)
+        except Exception as e:
+            print("❌ Overlay cache upload error:", e)
+
+    with _overlay_cache_lock:
+        _overlay_cache[key] = data
+        _overlay_cache.move_to_end(key)
+        while len(_overlay_cache) > OVERLAY_CACHE_SIZE:
+            _overlay_cache.popitem(last=False)
+
+    return data, content_type
@@ -0,0 +1,219 @@
+# ===============================
+# quantize_models.py
+# ===============================
+# INT8 post-training quantization (OpenVINO / NNCF ผ่าน ultralytics export)
+# - calibrate ด้วยภาพ valid/images (split "val" ใน data.yaml)
+# - ได้ <name>_int8_openvino_model/ ข้าง .pt → เลือกใช้ด้วย precision: int8
+# - report: เทียบจำนวนที่นับได้กับ test/labels + latency FP32 vs INT8
+#   + ขนาด weights (หน่วยความจำต่อ worker)
+#
+# ใช้งาน:
+#   python quantize_models.py                       # quantize + report
+#   python quantize_models.py --report-only         # ใช้ไฟล์ INT8 ที่มีอยู่
+#   QC_PRECISION=int8 uvicorn main:app
+# ===============================
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+import yaml
+from ultralytics import YOLO
+
+from export_models import DATASET_DIR, collect_targets
+from model_registry import exported_path
+
+DATA_YAML = os.path.join(DATASET_DIR, "data.yaml")
+TEST_DIR = os.path.join(DATASET_DIR, "test")
+REPORT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports", "quantization_report.json")
+
+
+# ===============================
+# Quantize
+# ===============================
+
+def quantize_one(target: dict, fraction: float) -> str:
+    model = YOLO(target["path"], task=target["task"])
+
+    out = model.export(
+        format="openvino",
+        int8=True,
+        data=DATA_YAML,          # calibration = split val (valid/images)
+        fraction=fraction,       # สัดส่วนภาพ calibration ที่ใช้
+        imgsz=target["imgsz"],
+        dynamic=True,
+    )
+
+    expected = exported_path(target["path"], "openvino", "int8")
+    if os.path.abspath(str(out).rstrip("/\\")) != os.path.abspath(expected):
+        print(f"⚠️ exported to {out} (registry expects {expected})")
+
+    return str(out)
+
+
+# ===============================
+# Evaluate
+# ===============================
+
+def load_labels(names: list[str]) -> dict[str, Counter]:
+    """{image stem: Counter(class name → จำนวน)} จาก test/labels (1 บรรทัด = 1 ชิ้น)"""
+    labels = {}
+
+    for path in glob.glob(os.path.join(TEST_DIR, "labels", "*.txt")):
+        counts = Counter()
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    counts[names[int(line.split()[0])]] += 1
+        labels[os.path.splitext(os.path.basename(path))[0]] = counts
+
+    return labels
+
+
+def _predicted_counts(result, target: dict) -> Counter:
+    # โมเดลเดี่ยว (potato / peas / carrot): ทุกกล่อง = dataset_class
+    if target["dataset_class"]:
+        return Counter({target["dataset_class"]: len(result.boxes)})
+
+    cls = result.boxes.cls.cpu().numpy().astype(int)
+    return Counter(result.names[c] for c in cls)
+
+
+def _weights_mb(path: str) -> float:
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 1e6
+
+    return sum(
+        os.path.getsize(os.path.join(root, f))
+        for root, _, files in os.walk(path)
+        for f in files
+    ) / 1e6
+
+
+def evaluate(target: dict, weights: str, images: list[str], labels: dict, names: list[str], args) -> dict:
+    model = YOLO(weights, task=target["task"])
+    classes = [target["dataset_class"]] if target["dataset_class"] else names
+
+    # warmup (ไม่นับเวลา)
+    model(images[0], imgsz=target["imgsz"], conf=args.conf, verbose=False)
+
+    abs_errors = []
+    rel_errors = []
+    exact = 0
+    latencies = []
+
+    for path in images:
+        started = time.perf_counter()
+        result = model(path, imgsz=target["imgsz"], conf=args.conf, verbose=False)[0]
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        predicted = _predicted_counts(result, target)
+        expected = labels.get(os.path.splitext(os.path.basename(path))[0], Counter())
+
+        errors = [abs(predicted[c] - expected[c]) for c in classes]
+        abs_errors.extend(errors)
+        rel_errors.extend(
+            abs(predicted[c] - expected[c]) / expected[c] for c in classes if expected[c]
+        )
+        exact += all(e == 0 for e in errors)
+
+    lat = np.array(latencies)
+
+    return {
+        "weights": weights,
+        "weights_mb": round(_weights_mb(weights), 2),
+        "count_mae": round(float(np.mean(abs_errors)), 3),
+        "count_mape": round(float(np.mean(rel_errors)), 4) if rel_errors else None,
+        "exact_match": round(exact / len(images), 4),
+        "latency_ms": {
+            "mean": round(float(lat.mean()), 2),
+            "p50": round(float(np.percentile(lat, 50)), 2),
+            "p95": round(float(np.percentile(lat, 95)), 2),
+        },
+    }
+
+
+def print_report(report: dict):
+    print()
+    print("| model | variant | MB | count MAE | count MAPE | exact | p50 ms | p95 ms |")
+    print("|---|---|---|---|---|---|---|---|")
+
+    for name, variants in report["models"].items():
+        for variant, r in variants.items():
+            mape = f"{r['count_mape']:.1%}" if r["count_mape"] is not None else "-"
+            print(
+                f"| {name} | {variant} | {r['weights_mb']:.1f} | {r['count_mae']:.2f} | {mape} | "
+                f"{r['exact_match']:.1%} | {r['latency_ms']['p50']:.1f} | {r['latency_ms']['p95']:.1f} |"
+            )
+
+
+# ===============================
+# Main
+# ===============================
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 quantization + accuracy/latency report")
+    parser.add_argument("--models", nargs="*", help="ชื่อโมเดล (ค่าเริ่มต้น: ทั้งหมด)")
+    parser.add_argument("--imgsz", type=int, default=0, help="0 = imgsz ใน models.yaml")
+    parser.add_argument("--fraction", type=float, default=1.0, help="สัดส่วนภาพ valid ที่ใช้ calibrate")
+    parser.add_argument("--report-only", action="store_true", help="ไม่ quantize ใหม่")
+    parser.add_argument("--limit", type=int, default=0, help="จำนวนภาพ test (0 = ทั้งหมด)")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--out", default=REPORT_PATH)
+    args = parser.parse_args()
+
+    with open(DATA_YAML, encoding="utf-8") as f:
+        names = yaml.safe_load(f)["names"]
+
+    images = sorted(glob.glob(os.path.join(TEST_DIR, "images", "*.jpg")))
+    if args.limit:
+        images = images[: args.limit]
+    if not images:
+        print(f"❌ No test images in {TEST_DIR}")
+        sys.exit(1)
+
+    labels = load_labels(names)
+    targets = [t for t in collect_targets(args.models, args.imgsz) if os.path.exists(t["path"])]
+    if not targets:
+        print("❌ No model weights found")
+        sys.exit(1)
+
+    report = {"test_images": len(images), "conf": args.conf, "models": {}}
+
+    for target in targets:
+        int8_path = exported_path(target["path"], "openvino", "int8")
+
+        if not args.report_only:
+            print(f"📦 Quantizing {target['name']} → INT8 (imgsz {target['imgsz']})")
+            int8_path = quantize_one(target, args.fraction)
+
+        variants = {"fp32": target["path"]}
+
+        fp32_ir = exported_path(target["path"], "openvino")
+        if os.path.exists(fp32_ir):
+            variants["fp32_openvino"] = fp32_ir
+        if os.path.exists(int8_path):
+            variants["int8"] = int8_path
+
+        report["models"][target["name"]] = {
+            variant: evaluate(target, weights, images, labels, names, args)
+            for variant, weights in variants.items()
+        }
+
+    print_report(report)
+
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"\n✅ Report saved: {args.out}")
+    print("   เลือก INT8 ต่อโมเดลด้วย precision: int8 ใน models.yaml (หรือ QC_PRECISION=int8)")
+
+
+if __name__ == "__main__":
+    main()
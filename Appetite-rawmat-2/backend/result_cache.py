@@ -0,0 +1,190 @@
+# ===============================
+# result_cache.py
+# ===============================
+# cache ผล QC แบบ content-addressed
+# - key = hash ของ pixel ที่ decode แล้ว + version ของโมเดล + conf
+#   (ภาพเดิมที่ส่งซ้ำ: frontend retry / upload ซ้ำ / กล้อง frame เดิม)
+# - hit → คืนผล + URL เดิมทันที ไม่รัน inference ไม่ upload ซ้ำ
+# - memory: LRU จำกัดทั้งจำนวน entry และขนาดรวม (bytes)
+# - disk (optional): ไฟล์ JSON ต่อ key, เกินขนาดรวม → ลบไฟล์ที่เก่าสุดก่อน
+# ===============================
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_SIZE = int(os.getenv("QC_RESULT_CACHE_SIZE", 256))
+CACHE_MB = float(os.getenv("QC_RESULT_CACHE_MB", 32))
+
+# ว่าง = ไม่ใช้ disk tier
+CACHE_DIR = os.getenv("QC_RESULT_CACHE_DIR", "")
+CACHE_DISK_MB = float(os.getenv("QC_RESULT_CACHE_DISK_MB", 256))
+
+
+def image_digest(img: np.ndarray) -> str:
+    """hash ของ pixel (รวม shape / dtype) — hashlib ปล่อย GIL ตอน hash buffer ใหญ่"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{img.shape}|{img.dtype}".encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+class ResultCache:
+
+    def __init__(self, max_entries: int, max_bytes: int, disk_dir: str = "", disk_max_bytes: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        # key → JSON bytes (คืน dict ใหม่ทุกครั้ง ผู้เรียกแก้ได้ไม่กระทบ cache)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    # ===============================
+    # Get / Put
+    # ===============================
+
+    def get(self, key: str) -> dict | None:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return json.loads(data)
+
+        data = self._disk_get(key)
+
+        with self._lock:
+            if data is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+            self._put_memory(key, data)
+
+        return json.loads(data)
+
+    def put(self, key: str, value: dict):
+        if not self.enabled:
+            return
+
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+        with self._lock:
+            self._put_memory(key, data)
+
+        self._disk_put(key, data)
+
+    def _put_memory(self, key: str, data: bytes):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+
+        self._entries[key] = data
+        self._bytes += len(data)
+
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._evictions += 1
+
+    # ===============================
+    # Disk tier
+    # ===============================
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key: str) -> bytes | None:
+        if not self.disk_dir:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)   # mtime = ใช้ล่าสุด (สำหรับ evict)
+            return data
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, data: bytes):
+        if not self.disk_dir:
+            return
+
+        try:
+            tmp = self._disk_path(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._disk_path(key))
+            self._disk_evict()
+        except OSError as e:
+            print("❌ Result cache disk write error:", e)
+
+    def _disk_evict(self):
+        files = []
+        total = 0
+
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".json"):
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+        files.sort()
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    # ===============================
+    # Stats
+    # ===============================
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round((self._hits + self._disk_hits) / lookups, 4) if lookups else 0.0,
+                "disk": bool(self.disk_dir),
+            }
+
+
+result_cache = ResultCache(
+    CACHE_SIZE,
+    int(CACHE_MB * 1024 * 1024),
+    CACHE_DIR,
+    int(CACHE_DISK_MB * 1024 * 1024),
+)
@@ -0,0 +1,311 @@
+# ===============================
+# storage/backends.py
+# ===============================
+# ที่เก็บไฟล์ภาพแบบเปลี่ยนได้ (เลือกด้วย QC_STORAGE_BACKEND)
+# - SupabaseStorage : bucket ของ Supabase (แบบเดิม)
+# - LocalStorage    : โฟลเดอร์ในเครื่อง, ชื่อไฟล์ = hash ของเนื้อไฟล์
+#                     → ภาพเดิมเก็บครั้งเดียว / ใช้แทน bucket ตอนทดสอบได้ ไม่ต้องมี network
+# - TieredStorage   : เขียนลง local ก่อน (เร็ว) แล้ว sync ขึ้น bucket เบื้องหลัง
+# ===============================
+
+import asyncio
+import hashlib
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import quote
+
+
+def random_object_path(filename: str, folder: str) -> str:
+    """path ไม่ซ้ำใน bucket: เวลา + uuid (แบบเดิม)"""
+    ext = filename.split(".")[-1]
+    unique_name = (
+        f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_"
+        f"{uuid.uuid4().hex}.{ext}"
+    )
+
+    return f"{folder}/{unique_name}"
+
+
+def content_object_path(filename: str, folder: str, data: bytes) -> str:
+    """path จาก sha256 ของเนื้อไฟล์ (ไฟล์เหมือนกัน = path เดียวกัน)"""
+    ext = filename.split(".")[-1]
+    return f"{folder}/{hashlib.sha256(data).hexdigest()}.{ext}"
+
+
+# ===============================
+# Supabase Storage
+# ===============================
+
+class SupabaseStorage:
+
+    def __init__(self, bucket: str):
+        # HTTP client ตัวเดียวกับ DB (connection pool ร่วมกัน)
+        # import ตอนใช้จริง → โหมด local ไม่ต้องมี Supabase
+        from database.async_client import async_db
+
+        self.bucket = bucket
+        self._db = async_db
+
+    def object_path(self, filename: str, folder: str, data: bytes | None = None) -> str:
+        return random_object_path(filename, folder)
+
+    def upload(self, data: bytes, path: str, content_type: str, upsert: bool) -> str:
+        return self._db.call(self.upload_async(data, path, content_type, upsert))
+
+    async def upload_async(self, data: bytes, path: str, content_type: str, upsert: bool) -> str:
+        return await self._db.upload(self.bucket, path, data, content_type, upsert)
+
+    def download(self, path: str) -> bytes:
+        return self._db.call(self._db.download(self.bucket, path))
+
+    def public_url(self, path: str) -> str:
+        return self._db.object_url("public", self.bucket, quote(path))
+
+    def signed_url(self, path: str, expires: int) -> str:
+        url = self.signed_urls([path], expires).get(path)
+
+        if url is None:
+            raise Exception("Create signed url failed")
+
+        return url
+
+    def signed_urls(self, paths: list[str], expires: int) -> dict[str, str]:
+        """เซ็นหลาย path ใน request เดียว → {path: url}"""
+        return self._db.call(self._db.signed_urls(self.bucket, paths, expires))
+
+    def start(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": "supabase", "bucket": self.bucket}
+
+
+# ===============================
+# Local (content-addressed)
+# ===============================
+
+class LocalStorage:
+
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._dedup = 0
+
+    def _file(self, path: str) -> str:
+        full = os.path.normpath(os.path.join(self.root, path))
+        if not full.startswith(os.path.normpath(self.root) + os.sep):
+            raise Exception(f"Invalid storage path: {path}")
+        return full
+
+    def object_path(self, filename: str, folder: str, data: bytes | None = None) -> str:
+        if data is None:
+            return random_object_path(filename, folder)
+        return content_object_path(filename, folder, data)
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(self._file(path))
+
+    def upload(self, data: bytes, path: str, content_type: str, upsert: bool) -> str:
+        full = self._file(path)
+
+        # path จาก hash → มีไฟล์แล้วคือเนื้อเดียวกัน ไม่ต้องเขียนซ้ำ
+        if not upsert and os.path.exists(full):
+            with self._lock:
+                self._dedup += 1
+            return path
+
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+
+        tmp = f"{full}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, full)
+
+        with self._lock:
+            self._writes += 1
+        return path
+
+    async def upload_async(self, data: bytes, path: str, content_type: str, upsert: bool) -> str:
+        return await asyncio.to_thread(self.upload, data, path, content_type, upsert)
+
+    def download(self, path: str) -> bytes:
+        with open(self._file(path), "rb") as f:
+            return f.read()
+
+    def public_url(self, path: str) -> str:
+        return f"{self.base_url}/{path}"
+
+    def signed_url(self, path: str, expires: int) -> str:
+        # ไฟล์ local เสิร์ฟผ่าน /files ตรง ๆ ไม่มี token
+        return self.public_url(path)
+
+    def signed_urls(self, paths: list[str], expires: int) -> dict[str, str]:
+        return {path: self.public_url(path) for path in paths}
+
+    def start(self):
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "local",
+                "root": self.root,
+                "writes": self._writes,
+                "dedup_hits": self._dedup,
+            }
+
+
+# ===============================
+# Tiered (local + sync ขึ้น bucket)
+# ===============================
+
+class TieredStorage:
+
+    def __init__(
+        self,
+        local: LocalStorage,
+        remote: SupabaseStorage,
+        retry_base: float = 1,
+        retry_max: float = 300,
+    ):
+        self.local = local
+        self.remote = remote
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+
+        # งานที่ยังไม่ sync เก็บเป็นไฟล์ → restart แล้วไม่หาย
+        # (อยู่นอก root เพราะ root ถูกเสิร์ฟเป็น /files)
+        self.sync_dir = f"{os.path.normpath(local.root)}_sync"
+        os.makedirs(self.sync_dir, exist_ok=True)
+
+        # heap ของ (เวลาที่ถึงกำหนด, marker)
+        self._heap = []
+        self._cond = threading.Condition()
+        self._started = False
+
+        self._synced = 0
+        self._retries = 0
+        self._last_error = None
+
+    @property
+    def root(self) -> str:
+        return self.local.root
+
+    def object_path(self, filename: str, folder: str, data: bytes | None = None) -> str:
+        return self.local.object_path(filename, folder, data)
+
+    def upload(self, data: bytes, path: str, content_type: str, upsert: bool) -> str:
+        if not upsert and self.local.exists(path):
+            # เนื้อเดียวกัน เคย upload (และตั้ง sync) ไปแล้ว
+            return self.local.upload(data, path, content_type, upsert)
+
+        self.local.upload(data, path, content_type, upsert)
+
+        marker = hashlib.sha1(path.encode()).hexdigest()
+        tmp = os.path.join(self.sync_dir, f"{marker}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"path": path, "content_type": content_type, "attempts": 0}, f)
+        os.replace(tmp, os.path.join(self.sync_dir, f"{marker}.json"))
+
+        self._schedule(marker, 0)
+        return path
+
+    async def upload_async(self, data: bytes, path: str, content_type: str, upsert: bool) -> str:
+        # เขียน local + marker เร็วอยู่แล้ว ส่วน bucket sync เบื้องหลัง
+        return await asyncio.to_thread(self.upload, data, path, content_type, upsert)
+
+    def download(self, path: str) -> bytes:
+        try:
+            return self.local.download(path)
+        except FileNotFoundError:
+            # ไฟล์เก่าก่อนเปิด tiered / เครื่องอื่น → ดึงจาก bucket แล้วเก็บ local ไว้
+            data = self.remote.download(path)
+            self.local.upload(data, path, "application/octet-stream", True)
+            return data
+
+    def public_url(self, path: str) -> str:
+        return self.local.public_url(path)
+
+    def signed_url(self, path: str, expires: int) -> str:
+        return self.local.signed_url(path, expires)
+
+    def signed_urls(self, paths: list[str], expires: int) -> dict[str, str]:
+        return self.local.signed_urls(paths, expires)
+
+    # ===============================
+    # Sync worker
+    # ===============================
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+
+        for name in sorted(os.listdir(self.sync_dir)):
+            if name.endswith(".json"):
+                self._schedule(name[:-len(".json")], 0)
+
+        threading.Thread(target=self._worker, name="storage-sync", daemon=True).start()
+
+    def _schedule(self, marker: str, delay: float):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, marker))
+            self._cond.notify()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                _, marker = heapq.heappop(self._heap)
+
+            marker_file = os.path.join(self.sync_dir, f"{marker}.json")
+            try:
+                with open(marker_file, encoding="utf-8") as f:
+                    job = json.load(f)
+            except FileNotFoundError:
+                continue
+
+            try:
+                self.remote.upload(
+                    self.local.download(job["path"]), job["path"], job["content_type"], True
+                )
+            except Exception as e:
+                job["attempts"] += 1
+                with open(marker_file, "w", encoding="utf-8") as f:
+                    json.dump(job, f)
+
+                delay = min(self.retry_base * 2 ** (job["attempts"] - 1), self.retry_max)
+                print(f"❌ Storage sync {job['path']} failed, retry in {delay:.0f}s:", e)
+
+                with self._cond:
+                    self._retries += 1
+                    self._last_error = str(e)
+                self._schedule(marker, delay)
+                continue
+
+            os.remove(marker_file)
+            with self._cond:
+                self._synced += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self.local.stats(),
+                "backend": "tiered",
+                "bucket": self.remote.bucket,
+                "sync_pending": len(self._heap),
+                "synced": self._synced,
+                "sync_retries": self._retries,
+                "last_error": self._last_error,
+            }
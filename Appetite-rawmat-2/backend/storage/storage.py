@@ -1,7 +1,13 @@
 # backend/storage/storage.py
-from database.supabase import supabase
-from datetime import datetime
-import uuid
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from database.async_client import async_db
+from storage.backends import LocalStorage, SupabaseStorage, TieredStorage
+from imaging import make_thumbnail
 
 # ===============================
 # CONFIG
@@ -9,69 +15,242 @@ import uuid
 
 BUCKET = "qc-images"
 
+# supabase (default) | local | tiered
+STORAGE_BACKEND = os.getenv("QC_STORAGE_BACKEND", "supabase")
+
+# local / tiered: โฟลเดอร์เก็บไฟล์ + URL ที่ main.py mount ไว้ (/files)
+# default เป็น path → main.py ต่อกับ host ของ request (ใช้ได้ทั้ง localhost / IP / proxy)
+# ตั้ง QC_STORAGE_BASE_URL เป็น URL เต็มเมื่อไฟล์เสิร์ฟจาก host อื่น (เช่น CDN)
+STORAGE_DIR = os.getenv(
+    "QC_STORAGE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "storage_data"),
+)
+STORAGE_BASE_URL = os.getenv("QC_STORAGE_BASE_URL", "/files")
+
+# bucket เป็น private → frontend ต้องใช้ signed URL แทน public URL
+STORAGE_PRIVATE = os.getenv("QC_STORAGE_PRIVATE", "false").lower() in ("1", "true", "yes")
+
+# signed URL: อายุ / เซ็นใหม่ก่อนหมดอายุกี่วินาที / จำนวนที่จำไว้
+SIGNED_URL_TTL = int(os.getenv("QC_SIGNED_URL_TTL", 3600))
+SIGNED_URL_REFRESH = int(os.getenv("QC_SIGNED_URL_REFRESH", 300))
+SIGNED_URL_CACHE_SIZE = int(os.getenv("QC_SIGNED_URL_CACHE_SIZE", 5000))
+
+# ภาพย่อสำหรับหน้า history: สร้างตอน upload ภาพ raw
+# (overlay ย่อได้อยู่แล้วผ่าน /qc/overlay?width=)
+# raw/abc.jpg → thumb/raw/abc.webp (path คำนวณจาก path เดิมได้ ไม่ต้องเก็บใน DB)
+THUMB_SIZE = int(os.getenv("QC_THUMB_SIZE", 320))
+THUMB_FORMAT = os.getenv("QC_THUMB_FORMAT", "webp")   # webp | jpeg
+THUMB_FOLDERS = tuple(
+    f for f in os.getenv("QC_THUMB_FOLDERS", "raw").split(",") if f
+)
+THUMB_CONTENT_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+def _create_store():
+    if STORAGE_BACKEND == "supabase":
+        return SupabaseStorage(BUCKET)
+
+    local = LocalStorage(STORAGE_DIR, STORAGE_BASE_URL)
+
+    if STORAGE_BACKEND == "local":
+        return local
+    if STORAGE_BACKEND == "tiered":
+        return TieredStorage(
+            local,
+            SupabaseStorage(BUCKET),
+            retry_base=float(os.getenv("QC_RETRY_BASE_SECONDS", 1)),
+            retry_max=float(os.getenv("QC_RETRY_MAX_SECONDS", 300)),
+        )
+
+    raise Exception(f"Unknown QC_STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+
+store = _create_store()
+
+
+def local_storage_root() -> str | None:
+    """โฟลเดอร์ที่ต้องเสิร์ฟเป็น static files (None = ใช้ bucket อย่างเดียว)"""
+    return getattr(store, "root", None)
+
+
+def start_storage():
+    """เริ่ม sync worker ของ tiered (backend อื่นไม่ทำอะไร)"""
+    store.start()
+
+
+def storage_stats() -> dict:
+    return store.stats()
+
+
+def make_object_path(filename: str, folder: str, data: bytes | None = None) -> str:
+    """
+    สร้าง path ใน bucket ล่วงหน้า (รู้ path ก่อน upload จริงได้)
+    data: เนื้อไฟล์ → local / tiered ใช้ hash เป็นชื่อ (ไฟล์ซ้ำเก็บครั้งเดียว)
+          supabase สุ่มชื่อใหม่ทุกครั้งเหมือนเดิม
+    """
+    return store.object_path(filename, folder, data)
+
 
 def upload_image(
     image_bytes: bytes,
     filename: str,
     folder: str,
-    content_type: str = "image/jpeg"
+    content_type: str = "image/jpeg",
+    path: str | None = None,
 ):
     """
-    upload รูปเข้า Supabase Storage
+    upload รูปเข้า storage ที่ตั้งไว้ (QC_STORAGE_BACKEND)
+    path: กำหนด path เอง (เขียนทับไฟล์เดิมได้) ถ้าไม่ส่งจะตั้งชื่อใหม่ใน folder
     return: path ของไฟล์ใน bucket
     """
 
-    # ===============================
-    # สร้างชื่อไฟล์ไม่ให้ซ้ำ
-    # ===============================
+    path, upsert = _resolve_upload_path(image_bytes, filename, folder, path)
+    store.upload(image_bytes, path, content_type, upsert)
 
-    ext = filename.split(".")[-1]
-    unique_name = (
-        f"{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_"
-        f"{uuid.uuid4().hex}.{ext}"
-    )
+    thumb = _thumbnail_for(image_bytes, folder)
+    if thumb is not None:
+        store.upload(thumb, thumb_path(path), THUMB_CONTENT_TYPES[THUMB_FORMAT], True)
 
-    path = f"{folder}/{unique_name}"
+    return path
 
-    # ===============================
-    # upload เข้า Supabase Storage
-    # ===============================
 
-    res = supabase.storage.from_(BUCKET).upload(
-        path,
-        image_bytes,
-        {"content-type": content_type}
-    )
+async def upload_image_async(
+    image_bytes: bytes,
+    filename: str,
+    folder: str,
+    content_type: str = "image/jpeg",
+    path: str | None = None,
+):
+    """
+    เหมือน upload_image แต่เป็น coroutine (รันบน loop ของ database.async_client)
+    supabase: ใช้ HTTP client ที่ pool ร่วมกับ DB
+    """
+    path, upsert = _resolve_upload_path(image_bytes, filename, folder, path)
 
-    # ===============================
-    # error handling (สำคัญมาก)
-    # ===============================
+    thumb = await asyncio.to_thread(_thumbnail_for, image_bytes, folder)
 
-    if hasattr(res, "error") and res.error:
-        raise Exception(f"Upload failed: {res.error.message}")
+    # ภาพเต็ม + ภาพย่อ upload พร้อมกัน
+    uploads = [store.upload_async(image_bytes, path, content_type, upsert)]
+    if thumb is not None:
+        uploads.append(
+            store.upload_async(thumb, thumb_path(path), THUMB_CONTENT_TYPES[THUMB_FORMAT], True)
+        )
 
+    await asyncio.gather(*uploads)
     return path
 
 
+def thumb_path(path: str) -> str:
+    """path ของภาพย่อคู่กับไฟล์ใน bucket"""
+    return f"thumb/{os.path.splitext(path)[0]}.{THUMB_FORMAT}"
+
+
+def _thumbnail_for(image_bytes: bytes, folder: str) -> bytes | None:
+    if folder not in THUMB_FOLDERS:
+        return None
+
+    # ภาพย่อพังไม่ควรทำให้ upload ภาพหลักล้ม (frontend fallback ไปใช้ overlay ย่อ)
+    try:
+        return make_thumbnail(image_bytes, THUMB_SIZE, THUMB_FORMAT)
+    except Exception as e:
+        print("⚠️ Thumbnail error:", e)
+        return None
+
+
+def _resolve_upload_path(image_bytes: bytes, filename: str, folder: str, path: str | None):
+    """return: (path, upsert)"""
+    if path is None:
+        return make_object_path(filename, folder, image_bytes), False
+
+    # path จาก hash ของเนื้อนี้ (local / tiered) → มีไฟล์แล้วไม่ต้องเขียนทับ
+    return path, path != make_object_path(filename, folder, image_bytes)
+
+
+def download_image(path: str) -> bytes:
+    """
+    ดาวน์โหลดไฟล์จาก bucket (raise ถ้าไม่มีไฟล์)
+    """
+    return store.download(path)
+
+
 def get_public_url(path: str) -> str:
     """
     ใช้กรณี bucket เป็น public
     frontend เรียกดูรูปได้ทันที
     """
-    return supabase.storage.from_(BUCKET).get_public_url(path)
+    return store.public_url(path)
 
 
-def get_signed_url(path: str, expires: int = 3600) -> str:
+def get_signed_url(path: str, expires: int = SIGNED_URL_TTL) -> str:
     """
     ใช้กรณี bucket เป็น private
-    ได้ url ชั่วคราว (default 1 ชั่วโมง)
+    ได้ url ชั่วคราว (default 1 ชั่วโมง) ผ่าน cache เดียวกับ get_signed_urls
     """
-    res = supabase.storage.from_(BUCKET).create_signed_url(path, expires)
+    url = get_signed_urls([path], expires).get(path)
 
-    if "signedURL" not in res:
+    if url is None:
         raise Exception("Create signed url failed")
 
-    return res["signedURL"]
+    return url
+
+
+# ===============================
+# SIGNED URL CACHE
+# ===============================
+# key = (path, expires) → (url, เวลาที่ต้องเซ็นใหม่)
+# เซ็นใหม่ก่อนหมดอายุจริง SIGNED_URL_REFRESH วินาที
+# → URL ที่ส่งให้ frontend ยังใช้ได้อีกอย่างน้อยเท่านั้นเสมอ
+# ===============================
+
+_signed_cache = OrderedDict()
+_signed_lock = threading.Lock()
+
+
+def get_signed_urls(paths: list[str], expires: int = SIGNED_URL_TTL) -> dict[str, str]:
+    """
+    signed URL ของหลาย path: ที่ cache ไว้และยังไม่ใกล้หมดอายุใช้เลย
+    ที่เหลือเซ็นรวมกันใน request เดียว
+    return: {path: url} (path ที่เซ็นไม่สำเร็จจะไม่มีใน dict)
+    """
+    now = time.monotonic()
+    urls = {}
+    missing = []
+
+    with _signed_lock:
+        for path in dict.fromkeys(p for p in paths if p):
+            entry = _signed_cache.get((path, expires))
+            if entry and entry[1] > now:
+                _signed_cache.move_to_end((path, expires))
+                urls[path] = entry[0]
+            else:
+                missing.append(path)
+
+    if not missing:
+        return urls
+
+    signed = store.signed_urls(missing, expires)
+    refresh_at = now + max(1, expires - SIGNED_URL_REFRESH)
+
+    with _signed_lock:
+        for path, url in signed.items():
+            _signed_cache[(path, expires)] = (url, refresh_at)
+            _signed_cache.move_to_end((path, expires))
+        while len(_signed_cache) > SIGNED_URL_CACHE_SIZE:
+            _signed_cache.popitem(last=False)
+
+    urls.update(signed)
+    return urls
+
+
+def get_image_urls(paths: list[str]) -> dict[str, str]:
+    """URL สำหรับ frontend: signed (bucket private, เซ็นรวดเดียว) หรือ public"""
+    if STORAGE_PRIVATE:
+        return get_signed_urls(paths)
+    return {path: store.public_url(path) for path in dict.fromkeys(p for p in paths if p)}
+
+
+def get_image_url(path: str) -> str | None:
+    return get_image_urls([path]).get(path)
 
 
 # ===============================
@@ -83,18 +262,8 @@ def get_qc_history(limit: int = 50):
     ดึงประวัติ QC จากตาราง qc_results
     เรียงล่าสุดก่อน
     """
-    res = (
-        supabase
-        .table("qc_results")
-        .select(
-            "id, image_name, image_url, overlay_url, total_weight, status, created_at"
-        )
-        .order("created_at", desc=True)
-        .limit(limit)
-        .execute()
-    )
-
-    if hasattr(res, "error") and res.error:
-        raise Exception(res.error.message)
-
-    return res.data
\ No newline at end of file
+    return async_db.call(async_db.select("qc_results", [
+        ("select", "id,image_name,image_url,overlay_url,total_weight,status,created_at"),
+        ("order", "created_at.desc"),
+        ("limit", str(limit)),
+    ]))
\ No newline at end of file
@@ -0,0 +1,202 @@
+# ===============================
+# stream_qc.py
+# ===============================
+# โหมดตรวจต่อเนื่องจากกล้อง
+# - หยิบ frame ล่าสุดจาก camera_grabber ตาม fps ที่ตั้งไว้
+# - inference ยังไม่เสร็จ / คิวเต็ม → ทิ้ง frame นั้น (ไม่สะสม backlog)
+# - ผลทุก frame ถูก publish ให้ client (SSE /qc/stream/events)
+# - บันทึกลง storage/DB เฉพาะตอน status เปลี่ยน หรือทุก ๆ N ผล
+# ===============================
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from broadcast import Broadcaster
+from camera import camera_grabber
+from imaging import encode_jpeg
+from inference_pool import inference_pool, QueueFull, PRIORITY_STREAM
+from persistence import persistence_queue
+from qc_service import run_qc, image_executor
+from storage.storage import make_object_path
+
+STREAM_FPS = float(os.getenv("QC_STREAM_FPS", 2))
+STREAM_PERSIST_EVERY = int(os.getenv("QC_STREAM_PERSIST_EVERY", 30))
+
+
+class StreamQC:
+
+    def __init__(self):
+        self.events = Broadcaster()
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._busy = threading.Event()   # มีงาน inference ค้างอยู่ 1 งาน
+        # สถิติถูกแก้จาก thread qc-stream / inference pool / image_executor
+        self._stats_lock = threading.Lock()
+
+        self.fps = STREAM_FPS
+        self.persist_every = STREAM_PERSIST_EVERY
+        self._reset_stats()
+
+    def _reset_stats(self):
+        with self._stats_lock:
+            self._processed = 0
+            self._dropped = 0
+            self._persisted = 0
+            self._since_persist = 0
+            self._last_status = None
+
+    def _count_dropped(self):
+        with self._stats_lock:
+            self._dropped += 1
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # ===============================
+    # Control
+    # ===============================
+
+    def start(self, fps: float | None = None, persist_every: int | None = None) -> bool:
+        with self._lock:
+            if fps:
+                self.fps = fps
+            if persist_every:
+                self.persist_every = persist_every
+
+            if self.is_running:
+                return True
+
+            if not camera_grabber.start():
+                return False
+
+            self._reset_stats()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="qc-stream", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            if self._thread is None:
+                return
+            self._stop.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def status(self) -> dict:
+        with self._stats_lock:
+            processed, dropped, persisted = self._processed, self._dropped, self._persisted
+
+        return {
+            "running": self.is_running,
+            "fps": self.fps,
+            "persist_every": self.persist_every,
+            "processed": processed,
+            "dropped": dropped,
+            "persisted": persisted,
+            "subscribers": self.events.subscriber_count,
+        }
+
+    # ===============================
+    # Loop
+    # ===============================
+
+    def _loop(self):
+        last_seq = None
+
+        while not self._stop.is_set():
+            started = time.monotonic()
+
+            latest = camera_grabber.latest()
+
+            if latest is not None and latest[0] != last_seq:
+                last_seq, _, frame = latest
+
+                if self._busy.is_set():
+                    # inference ตามไม่ทัน → ข้าม frame นี้
+                    self._count_dropped()
+                else:
+                    self._submit(last_seq, frame)
+
+            self._stop.wait(max(0.0, 1 / self.fps - (time.monotonic() - started)))
+
+    def _submit(self, seq: int, frame):
+        try:
+            fut = inference_pool.submit(run_qc, frame, priority=PRIORITY_STREAM)
+        except QueueFull:
+            self._count_dropped()
+            return
+
+        self._busy.set()
+        fut.add_done_callback(lambda f: self._on_result(seq, frame, f))
+
+    def _on_result(self, seq: int, frame, fut):
+        self._busy.clear()
+
+        try:
+            result = fut.result()
+        except QueueFull:
+            # ถูกไล่ออกจากคิวให้งาน upload / กล้อง
+            self._count_dropped()
+            return
+        except Exception as e:
+            print("❌ Stream QC error:", e)
+            self.events.publish({"seq": seq, "error": "QC processing failed"})
+            return
+
+        with self._stats_lock:
+            self._processed += 1
+
+        event = {
+            "seq": seq,
+            "created_at": datetime.utcnow().isoformat(),
+            "total_count": result["total_count"],
+            "status": result["status"],
+            "spec": result["spec"],
+            "items": result["items"],
+            "id_qc": None,
+        }
+
+        if self._should_persist(result["status"]):
+            # callback นี้รันบน thread ของ inference pool → encode + เขียน spool
+            # ย้ายไป image_executor ไม่ให้ถ่วงงาน inference ถัดไป (รวม manual upload)
+            image_executor.submit(self._persist, event, frame, result)
+            return
+
+        self.events.publish(event)
+
+    def _persist(self, event: dict, frame, result: dict):
+        try:
+            filename = f"stream_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+            raw_bytes = encode_jpeg(frame)
+            job = persistence_queue.enqueue(
+                make_object_path(filename, "raw", raw_bytes), raw_bytes, result
+            )
+            event["id_qc"] = job["job_id"]
+            event["created_at"] = job["created_at"]
+            with self._stats_lock:
+                self._persisted += 1
+        except Exception as e:
+            print("❌ Stream persist error:", e)
+
+        self.events.publish(event)
+
+    def _should_persist(self, status: str) -> bool:
+        """บันทึกเมื่อ status เปลี่ยน หรือครบทุก persist_every ผล"""
+        with self._stats_lock:
+            self._since_persist += 1
+
+            if status != self._last_status or self._since_persist >= self.persist_every:
+                self._last_status = status
+                self._since_persist = 0
+                return True
+
+            return False
+
+
+stream_qc = StreamQC()
@@ -4,8 +4,13 @@ from PIL import Image, ImageTk
 from ultralytics import YOLO
 import cv2
 import os
+import sys
 import threading
 
+# ใช้ตัววาด overlay เดียวกับ backend (polylines ครั้งเดียว + วาดที่ขนาดแสดงผล)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from overlay_renderer import OverlayRenderer
+
 # --- ตั้งค่า Path ของโมเดลทั้งหมด ---
 MODEL_CONFIGS = {
     "Potato Model": {
@@ -53,6 +58,15 @@ class QCInspectionApp:
         # State
         self.current_image_path = None
         self.counts = {name: 0 for name in MODEL_CONFIGS}
+        self.canvas_size = (1, 1)
+
+        # label ในภาพใช้ชื่อสั้น ("Potato") → key ของ renderer เป็นชื่อสั้น
+        self.renderer = OverlayRenderer({
+            name.split()[0]: {
+                "bgr": tuple(int(cfg["color"].lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+            }
+            for name, cfg in MODEL_CONFIGS.items()
+        })
 
         # UI
         self.setup_ui()
@@ -90,6 +104,10 @@ class QCInspectionApp:
 
         self.canvas_frame = tk.Frame(image_frame, bg="#bdc3c7", bd=2, relief="sunken")
         self.canvas_frame.pack(fill="both", expand=True)
+        # ขนาดพื้นที่แสดงภาพ (อ่านจาก worker thread ได้ ไม่ต้องเรียก winfo นอก main thread)
+        self.canvas_frame.bind(
+            "<Configure>", lambda e: setattr(self, "canvas_size", (e.width, e.height))
+        )
 
         self.lbl_image = tk.Label(
             self.canvas_frame,
@@ -235,23 +253,27 @@ class QCInspectionApp:
     # ทุกโมเดล
     def _run_all_models(self, conf):
         img_base = cv2.imread(self.current_image_path)
-        image = img_base.copy()
+        h, w = img_base.shape[:2]
+        detections = {"image_size": [w, h], "models": {}}
         total = 0
 
         for name, model in self.models.items():
             results = model.predict(source=self.current_image_path, conf=conf)
-            boxes = results[0].boxes
-            count = len(boxes)
+            # box + conf ทั้งโมเดลมา host ใน transfer เดียว (ไม่ .cpu() ทีละกล่อง)
+            data = results[0].boxes.data.cpu().numpy()
+            count = len(data)
             total += count
-            color = tuple(int(MODEL_CONFIGS[name]["color"].lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy().astype(int)
-                conf_val = float(box.conf[0])
-                cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
-                cv2.putText(image, f"{name.split()[0]} {conf_val:.2f}", (x1, max(y1-6, 12)),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+            detections["models"][name.split()[0]] = {
+                "xyxy": data[:, :4].tolist(),
+                "conf": data[:, 4].tolist(),
+            }
             self.root.after(0, lambda n=name, c=count: self._update_count(n, c))
 
+        # วาดที่ขนาดที่จะแสดงจริง (ไม่วาดเต็มความละเอียดแล้วค่อยย่อ)
+        max_w, max_h = self.canvas_size
+        image = self.renderer.render(img_base, detections, width=w * min(max_w / w, max_h / h))
+
+        # cvtColor คืนภาพใหม่ → ไม่ผูกกับ buffer ของ renderer
         img_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
         self.root.after(0, lambda: self._display_image(img_pil))
         self.root.after(0, lambda: self.lbl_total.config(text=str(total)))
@@ -1,4 +1,4 @@
-import { useEffect, useState, Fragment } from "react";
+import { useEffect, useState, Fragment, type SyntheticEvent } from "react";
 import "./QCHistory.css";
 
 type QCItem = {
@@ -10,6 +10,10 @@ type QCItem = {
 type QCHistory = {
   id_qc: number;
   image_name: string;
+  image_url: string | null;
+  thumb_url: string | null;
+  overlay_url: string;
+  overlay_thumb_url: string;
   total_count: number;
   status: "PASS" | "FAIL";
   created_at: string;
@@ -21,6 +25,8 @@ export default function QCHistory() {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [openId, setOpenId] = useState<number | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const [range, setRange] = useState<"day" | "week" | "month"| "year">("day");
   const [date, setDate] = useState(
@@ -30,27 +36,41 @@ export default function QCHistory() {
   // =========================
   // 🔹 โหลดข้อมูล (ทั้งหมด / ตาม filter)
   // =========================
-  const fetchHistory = () => {
-    setLoading(true);
+  // cursor = null → หน้าแรก, มีค่า → ต่อท้ายหน้าถัดไป
+  const fetchHistory = (cursor: string | null = null) => {
+    if (cursor) {
+      setLoadingMore(true);
+    } else {
+      setLoading(true);
+    }
     setError(null);
 
-    let url = "http://127.0.0.1:8000/qc/history";
+    const params = new URLSearchParams();
 
     // ✅ ถ้ามี filter ค่อยส่ง query
     if (range && date) {
-      url += `?range=${range}&date=${date}`;
+      params.set("range", range);
+      params.set("date", date);
+    }
+    if (cursor) {
+      params.set("cursor", cursor);
     }
 
-    fetch(url)
+    fetch(`http://127.0.0.1:8000/qc/history?${params.toString()}`)
       .then(res => {
         if (!res.ok) throw new Error("โหลดข้อมูลไม่สำเร็จ");
         return res.json();
       })
       .then(data => {
-        setHistory(Array.isArray(data) ? data : []);
+        const rows: QCHistory[] = Array.isArray(data?.data) ? data.data : [];
+        setHistory(prev => (cursor ? [...prev, ...rows] : rows));
+        setNextCursor(data?.next_cursor ?? null);
       })
       .catch(err => setError(err.message))
-      .finally(() => setLoading(false));
+      .finally(() => {
+        setLoading(false);
+        setLoadingMore(false);
+      });
   };
 
   // 🔹 โหลดครั้งแรก → ดึงทั้งหมด
@@ -73,6 +93,17 @@ export default function QCHistory() {
       minute: "2-digit",
     });
 
+  // ภาพย่อยังไม่มี (แถวเก่าก่อนมี thumbnail) → ใช้ overlay ขนาดย่อแทน
+  const handleThumbError = (
+    e: SyntheticEvent<HTMLImageElement>,
+    row: QCHistory
+  ) => {
+    const img = e.currentTarget;
+    if (img.src !== row.overlay_thumb_url) {
+      img.src = row.overlay_thumb_url;
+    }
+  };
+
   if (loading) return <p>⏳ กำลังโหลดประวัติ QC...</p>;
   if (error) return <p style={{ color: "red" }}>❌ {error}</p>;
 
@@ -119,7 +150,17 @@ export default function QCHistory() {
                 {/* ===== qc_result ===== */}
                 <tr>
                   <td>{formatThaiTime(row.created_at)}</td>
-                  <td>{row.image_name}</td>
+                  <td>
+                    <img
+                      className="qc-thumb"
+                      src={row.thumb_url ?? row.overlay_thumb_url}
+                      alt={row.image_name}
+                      title={row.image_name}
+                      loading="lazy"
+                      decoding="async"
+                      onError={e => handleThumbError(e, row)}
+                    />
+                  </td>
                   <td>{row.total_count.toFixed(2)}</td>
                   <td>
                     <span
@@ -146,6 +187,18 @@ export default function QCHistory() {
                 {openId === row.id_qc && (
                   <tr className="qc-item-row">
                     <td colSpan={5}>
+                      {/* ภาพเต็มโหลดเฉพาะแถวที่เปิดดู */}
+                      <div className="qc-full-images">
+                        {row.image_url && (
+                          <a href={row.image_url} target="_blank" rel="noreferrer">
+                            <img src={row.image_url} alt={row.image_name} />
+                          </a>
+                        )}
+                        <a href={row.overlay_url} target="_blank" rel="noreferrer">
+                          <img src={row.overlay_url} alt={`${row.image_name} overlay`} />
+                        </a>
+                      </div>
+
                       <table className="qc-item-table">
                         <thead>
                           <tr>
@@ -178,6 +231,16 @@ export default function QCHistory() {
           </tbody>
         </table>
       )}
+
+      {nextCursor && (
+        <button
+          className="qc-toggle"
+          disabled={loadingMore}
+          onClick={() => fetchHistory(nextCursor)}
+        >
+          {loadingMore ? "กำลังโหลด..." : "โหลดเพิ่ม"}
+        </button>
+      )}
     </div>
   );
 }